@@ -0,0 +1,201 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from db import (
+    get_ai_cache, get_ai_cache_async,
+    save_ai_cache, save_ai_cache_async,
+    clear_ai_cache,
+    purge_ai_cache, purge_ai_cache_async,
+)
+
+AI_CACHE_MAX_ITEMS = int(os.getenv("AI_CACHE_MAX_ITEMS", "512"))
+AI_CACHE_PERSIST = os.getenv("AI_CACHE_PERSIST", "true").lower() in ("1", "true", "yes")
+# не чаще раза в столько секунд запись в кэш удаляет из SQLite все просроченные строки
+AI_CACHE_PURGE_INTERVAL = float(os.getenv("AI_CACHE_PURGE_INTERVAL", "3600"))
+
+# ===== Ключ кэша =====
+
+
+def normalize_prompt(prompt: str) -> str:
+    # регистр и пробелы не меняют смысл вопроса: "counter Fanny" == "counter  fanny"
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def make_cache_key(model: str, system_hint: str, prompt: str) -> str:
+    raw = "\x1f".join([model, system_hint or "", normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+# ===== LRU + TTL, второй уровень — SQLite =====
+
+
+class ResponseCache:
+    def __init__(self, max_items: int = AI_CACHE_MAX_ITEMS, persist: bool = AI_CACHE_PERSIST):
+        self.max_items = max_items
+        self.persist = persist
+        self._items: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # key -> (text, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.purged = 0
+        self._next_purge = 0.0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        text = self._get_memory(key, now)
+        if text is None and self.persist:
+            text = self._get_db(key, now)
+        if text is None:
+            self._count_miss()
+        return text
+
+    async def get_async(self, key: str) -> Optional[str]:
+        # память проверяем прямо в event loop, SQLite — через aiosqlite
+        now = time.time()
+        text = self._get_memory(key, now)
+        if text is None and self.persist:
+            text = await self._get_db_async(key, now)
+        if text is None:
+            self._count_miss()
+        return text
+
+    def put(self, key: str, kind: str, text: str, ttl: int):
+        expires_at = time.time() + ttl
+        self._remember(key, text, expires_at)
+        if self.persist:
+            self._save_db(key, kind, text, expires_at)
+            if self._purge_due():
+                self._purge_db()
+
+    async def put_async(self, key: str, kind: str, text: str, ttl: int):
+        expires_at = time.time() + ttl
+        self._remember(key, text, expires_at)
+        if self.persist:
+            await self._save_db_async(key, kind, text, expires_at)
+            if self._purge_due():
+                await self._purge_db_async()
+
+    def note_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self, kind: Optional[str] = None) -> int:
+        # в памяти kind не хранится — при частичной очистке сбрасываем весь LRU,
+        # он быстро наполнится заново из SQLite
+        with self._lock:
+            self._items.clear()
+        if self.persist:
+            return clear_ai_cache(kind)
+        return 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "persist": self.persist,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "purged": self.purged,
+            }
+
+    def _get_memory(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            text, expires_at = item
+            if expires_at <= now:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def _get_db(self, key: str, now: float) -> Optional[str]:
+        try:
+            entry = get_ai_cache(key, now)
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+            return None
+        return self._db_hit(key, entry)
+
+    async def _get_db_async(self, key: str, now: float) -> Optional[str]:
+        try:
+            entry = await get_ai_cache_async(key, now)
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+            return None
+        return self._db_hit(key, entry)
+
+    def _db_hit(self, key: str, entry) -> Optional[str]:
+        if entry is None:
+            return None
+        self._remember(key, entry.text, entry.expires_at)
+        with self._lock:
+            self.db_hits += 1
+        return entry.text
+
+    def _save_db(self, key: str, kind: str, text: str, expires_at: float):
+        try:
+            save_ai_cache(key, kind, text, expires_at,
+                          datetime.now(timezone.utc).isoformat())
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+
+    async def _save_db_async(self, key: str, kind: str, text: str, expires_at: float):
+        try:
+            await save_ai_cache_async(key, kind, text, expires_at,
+                                      datetime.now(timezone.utc).isoformat())
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+
+    def _purge_due(self) -> bool:
+        # чистим на записи: таблица растёт только от них
+        now = time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + AI_CACHE_PURGE_INTERVAL
+            return True
+
+    def _purge_db(self):
+        try:
+            n = purge_ai_cache(time.time())
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+            return
+        with self._lock:
+            self.purged += n
+
+    async def _purge_db_async(self):
+        try:
+            n = await purge_ai_cache_async(time.time())
+        except Exception as e:
+            print("[AI cache ERROR]", e)
+            return
+        with self._lock:
+            self.purged += n
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _remember(self, key: str, text: str, expires_at: float):
+        with self._lock:
+            self._items[key] = (text, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+response_cache = ResponseCache()
@@ -1,51 +1,365 @@
 import os
-import google.generativeai as genai
-from typing import List, Dict, Optional
+import time
+import asyncio
+import threading
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, AsyncIterator
+
+from ai_cache import response_cache, make_cache_key
+from singleflight import inflight
+from metrics import track, count_fallback
+from breaker import CircuitBreaker
+
+if TYPE_CHECKING:  # только для аннотаций: сам SDK грузится лениво в _genai()
+    import google.generativeai as genai
 
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# сколько запросов к Gemini может одновременно висеть из async-маршрутов
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+
+# TTL кэша ответов по типу запроса (секунды, 0 — не кэшировать).
+# Квизы и челленджи не кэшируем: там нужна новизна на каждый вызов.
+# Tier list кэшируется отдельно (tier_cache.py, stale-while-revalidate).
+AI_CACHE_TTLS: Dict[str, int] = {
+    "hero_post": int(os.getenv("AI_CACHE_TTL_HERO_POST", "3600")),
+    "counter_pick": int(os.getenv("AI_CACHE_TTL_COUNTER_PICK", "86400")),
+    "patch_explain": int(os.getenv("AI_CACHE_TTL_PATCH_EXPLAIN", "604800")),
+}
+
+_gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+_slot_timeouts = 0  # запросы, не дождавшиеся слота до своего дедлайна
+
+# Дедлайны на один вызов Gemini по типу запроса (секунды)
+AI_DEADLINES: Dict[str, float] = {
+    "hero_post": float(os.getenv("AI_DEADLINE_HERO_POST", "15")),
+    "counter_pick": float(os.getenv("AI_DEADLINE_COUNTER_PICK", "20")),
+    "tier_list": float(os.getenv("AI_DEADLINE_TIER_LIST", "25")),
+    "quiz": float(os.getenv("AI_DEADLINE_QUIZ", "15")),
+    "quiz_batch": float(os.getenv("AI_DEADLINE_QUIZ_BATCH", "45")),
+    "daily": float(os.getenv("AI_DEADLINE_DAILY", "15")),
+    "patch_explain": float(os.getenv("AI_DEADLINE_PATCH_EXPLAIN", "30")),
+}
+AI_DEADLINE_DEFAULT = float(os.getenv("AI_DEADLINE_DEFAULT", "20"))
+
+# Пока breaker открыт, Gemini не вызываем — генераторы сразу отдают fallback-тексты
+gemini_breaker = CircuitBreaker(
+    "gemini",
+    failure_threshold=int(os.getenv("GEMINI_BREAKER_FAILURES", "5")),
+    slow_call_seconds=float(os.getenv("GEMINI_BREAKER_SLOW_SECONDS", "12")),
+    reset_timeout=float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30")),
+)
+# пачка из N вопросов законно генерируется дольше обычного ответа — свой порог «медленного» вызова
+AI_SLOW_SECONDS: Dict[str, float] = {
+    "quiz_batch": float(os.getenv("GEMINI_BREAKER_SLOW_SECONDS_QUIZ_BATCH", "40")),
+}
+
+# максимум вопросов за один вызов generate_quizzes
+QUIZ_BATCH_MAX = int(os.getenv("QUIZ_BATCH_MAX", "10"))
+
+SYSTEM_HERO_POST = "Ты — редактор русскоязычного Telegram-канала по MLBB. Пиши короткие, энергичные посты."
+SYSTEM_COUNTER_PICK = "Ты — эксперт по MLBB. Даёшь практичные советы и контр-пики на русском языке."
+SYSTEM_TIER_LIST = "Ты — аналитик MLBB. Формируешь tier list в JSON для Telegram Mini App."
+SYSTEM_QUIZ = "Ты — тренер MLBB. Генерируешь тестовые вопросы (multiple choice) на русском."
+SYSTEM_DAILY = "Ты — креативный менеджер MLBB. Придумываешь челленджи для игроков."
+SYSTEM_PATCH = "Ты — аналитик патчноутов MLBB. Объясняешь изменения простым языком."
+
+# ===== Реестр моделей =====
+# google.generativeai тянет за собой gRPC, protobuf и IPython — около секунды
+# на импорт, поэтому SDK грузится при первом обращении, а не при старте.
+# Одна GenerativeModel на system_hint. Все модели ходят через общий
+# gRPC-клиент из genai (он живёт до следующего genai.configure), поэтому
+# configure вызываем только один раз — при загрузке SDK.
+
+_genai_module = None
+_genai_lock = threading.Lock()
+_models: Dict[str, "genai.GenerativeModel"] = {}
+_models_lock = threading.Lock()
+
+
+def _genai():
+    global _genai_module
+    if _genai_module is None:
+        with _genai_lock:
+            if _genai_module is None:
+                import google.generativeai as genai
+                if GEMINI_API_KEY:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _genai_module = genai
+    return _genai_module
+
+
+def get_model(system_hint: Optional[str] = None) -> "genai.GenerativeModel":
+    key = system_hint or ""
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                model = _genai().GenerativeModel(
+                    GEMINI_MODEL, system_instruction=system_hint or None)
+                _models[key] = model
+    return model
+
+
+def warm_up_models():
+    """Prebuild models for every system hint and open the shared clients."""
+    if not GEMINI_API_KEY:
+        return
+    for hint in (None, SYSTEM_HERO_POST, SYSTEM_COUNTER_PICK, SYSTEM_TIER_LIST,
+                 SYSTEM_QUIZ, SYSTEM_DAILY, SYSTEM_PATCH):
+        get_model(hint)
+    try:
+        from google.generativeai import client as genai_client
+        genai_client.get_default_generative_client()
+        genai_client.get_default_generative_async_client()
+    except Exception as e:
+        print("[Gemini WARMUP ERROR]", e)
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+
+async def warm_up_models_async():
+    # сам импорт SDK — в потоке, чтобы не держать event loop;
+    # клиенты создаём уже в потоке loop: async gRPC-клиент привязывается к нему
+    if not GEMINI_API_KEY:
+        return
+    await asyncio.to_thread(_genai)
+    warm_up_models()
 
 # ===== Общий помощник =====
 
 
-def _call_gemini(prompt: str, system_hint: str) -> str:
+def _deadline(kind: Optional[str]) -> float:
+    return AI_DEADLINES.get(kind or "", AI_DEADLINE_DEFAULT)
+
+
+def _cache_key(prompt: str, system_hint: str, kind: Optional[str]) -> Optional[str]:
+    if AI_CACHE_TTLS.get(kind or "", 0) <= 0:
+        return None
+    return make_cache_key(GEMINI_MODEL, system_hint, prompt)
+
+
+def _call_gemini(prompt: str, system_hint: str, kind: Optional[str] = None, fresh: bool = False) -> str:
     if not GEMINI_API_KEY:
         return ""
+    key = _cache_key(prompt, system_hint, kind)
+    if key:
+        if fresh:
+            response_cache.note_bypass()
+        else:
+            cached = response_cache.get(key)
+            if cached is not None:
+                return cached
+    if not gemini_breaker.allow():
+        return ""
+    deadline = _deadline(kind)
+    started = time.monotonic()
     try:
-        model = genai.GenerativeModel(
-            GEMINI_MODEL, system_instruction=system_hint)
-        resp = model.generate_content(prompt)
-        return (getattr(resp, "text", "") or "").strip()
+        with track("gemini", kind or "other"):
+            resp = get_model(system_hint).generate_content(
+                prompt, request_options={"timeout": deadline})
+        text = (getattr(resp, "text", "") or "").strip()
     except Exception as e:
         print("[Gemini ERROR]", e)
+        gemini_breaker.record_failure(repr(e))
+        return ""
+    gemini_breaker.record_success(time.monotonic() - started, AI_SLOW_SECONDS.get(kind or ""))
+    if key and text:
+        response_cache.put(key, kind, text, AI_CACHE_TTLS[kind])
+    return text
+
+
+async def _call_gemini_async(prompt: str, system_hint: str, kind: Optional[str] = None, fresh: bool = False) -> str:
+    if not GEMINI_API_KEY:
+        return ""
+    key = _cache_key(prompt, system_hint, kind)
+    if not key:
+        return await _generate_async(prompt, system_hint, kind)
+    if fresh:
+        response_cache.note_bypass()
+        return await _generate_and_cache_async(key, prompt, system_hint, kind)
+    cached = await response_cache.get_async(key)
+    if cached is not None:
+        return cached
+    # одинаковые вопросы, пришедшие одновременно, ждут один общий ответ Gemini
+    return await inflight.do(
+        key, lambda: _generate_and_cache_async(key, prompt, system_hint, kind))
+
+
+async def _generate_and_cache_async(key: str, prompt: str, system_hint: str, kind: str) -> str:
+    text = await _generate_async(prompt, system_hint, kind)
+    if text:
+        await response_cache.put_async(key, kind, text, AI_CACHE_TTLS[kind])
+    return text
+
+
+async def _acquire_slot(kind: Optional[str], deadline: float) -> bool:
+    # очередь за семафором — часть дедлайна: кто не дождался слота, получает fallback
+    global _slot_timeouts
+    try:
+        await asyncio.wait_for(_gemini_semaphore.acquire(), timeout=deadline)
+        return True
+    except asyncio.TimeoutError:
+        _slot_timeouts += 1
+        print(f"[Gemini] no free slot for {kind or 'other'} within {deadline:.1f}s")
+        return False
+
+
+def gemini_slot_stats() -> Dict:
+    return {"max_concurrency": GEMINI_MAX_CONCURRENCY, "free": _gemini_semaphore._value, "timeouts": _slot_timeouts}
+
+
+async def _generate_async(prompt: str, system_hint: str, kind: Optional[str] = None) -> str:
+    # ready() — до очереди (открытый брейкер отказывает сразу), allow() — уже со слотом:
+    # пока ждали, брейкер мог открыться, и вставшие в очередь не должны идти в Gemini
+    if not gemini_breaker.ready():
+        return ""
+    deadline = _deadline(kind)
+    queued = time.monotonic()
+    if not await _acquire_slot(kind, deadline):
         return ""
+    try:
+        if not gemini_breaker.allow():
+            return ""
+        left = max(deadline - (time.monotonic() - queued), 0.001)
+        started = time.monotonic()
+        try:
+            model = get_model(system_hint)
+            with track("gemini", kind or "other"):
+                resp = await asyncio.wait_for(
+                    model.generate_content_async(prompt, request_options={"timeout": left}),
+                    timeout=left,
+                )
+            text = (getattr(resp, "text", "") or "").strip()
+        except Exception as e:
+            print("[Gemini ERROR]", repr(e))
+            gemini_breaker.record_failure(repr(e))
+            return ""
+    finally:
+        _gemini_semaphore.release()
+    gemini_breaker.record_success(time.monotonic() - started, AI_SLOW_SECONDS.get(kind or ""))
+    return text
+
+
+class StreamInterrupted(RuntimeError):
+    """Gemini stream failed after part of the answer was already sent."""
+
+
+async def _stream_gemini_async(prompt: str, system_hint: str, kind: Optional[str] = None, fresh: bool = False) -> AsyncIterator[str]:
+    # отдаём куски по мере генерации, целый текст в конце кладём в тот же кэш.
+    # Обрыв до первого куска — просто пустой стрим (дальше fallback), обрыв
+    # посреди ответа — StreamInterrupted: недописанный текст не кэшируем
+    if not GEMINI_API_KEY:
+        return
+    key = _cache_key(prompt, system_hint, kind)
+    if key:
+        if fresh:
+            response_cache.note_bypass()
+        else:
+            cached = await response_cache.get_async(key)
+            if cached is not None:
+                yield cached
+                return
+    if not gemini_breaker.ready():
+        return
+    parts: List[str] = []
+    deadline = _deadline(kind)
+    # дедлайн общий на весь ответ, включая ожидание слота
+    queued = time.monotonic()
+    if not await _acquire_slot(kind, deadline):
+        return
+    try:
+        if not gemini_breaker.allow():
+            return
+        started = time.monotonic()
+        try:
+            model = get_model(system_hint)
+            with track("gemini", f"{kind or 'other'}_stream"):
+                # каждый следующий чанк ждём не дольше остатка дедлайна
+                left = max(deadline - (started - queued), 0.001)
+                resp = await asyncio.wait_for(
+                    model.generate_content_async(
+                        prompt, stream=True, request_options={"timeout": left}),
+                    timeout=left,
+                )
+                chunks = resp.__aiter__()
+                first_at = None
+                while True:
+                    left = deadline - (time.monotonic() - queued)
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(left, 0.001))
+                    except StopAsyncIteration:
+                        break
+                    try:
+                        piece = chunk.text or ""
+                    except Exception:
+                        piece = ""  # служебный чанк без текста (finish_reason и т.п.)
+                    if piece:
+                        first_at = first_at or time.monotonic()
+                        parts.append(piece)
+                        yield piece
+            # для стрима «медленный» — это долгое ожидание первого куска, а не длина ответа
+            gemini_breaker.record_success((first_at or time.monotonic()) - started)
+        except Exception as e:
+            print("[Gemini ERROR]", repr(e))
+            gemini_breaker.record_failure(repr(e))
+            if parts:
+                raise StreamInterrupted(f"{kind or 'other'} stream interrupted: {e!r}") from e
+            return
+    finally:
+        _gemini_semaphore.release()
+    text = "".join(parts).strip()
+    if key and text:
+        await response_cache.put_async(key, kind, text, AI_CACHE_TTLS[kind])
+
+
+async def _stream_with_fallback(chunks: AsyncIterator[str], kind: str, fallback: str) -> AsyncIterator[str]:
+    empty = True
+    async for piece in chunks:
+        empty = False
+        yield piece
+    if empty:
+        count_fallback(kind)
+        yield fallback
 
 # ===== Герой-пост (как было) =====
 
 
-def generate_hero_post(hero: str) -> str:
-    system = (
-        "Ты — редактор русскоязычного Telegram-канала по MLBB. Пиши короткие, энергичные посты."
-    )
+def _hero_post_prompt(hero: str) -> Tuple[str, str]:
+    system = SYSTEM_HERO_POST
     prompt = f"""
 Герой: {hero}
 Задача: напиши 1–2 коротких предложения на русском о приёме, трюке или полезном совете с этим героем в Mobile Legends.
 Стиль: живой, мотивирующий, как подпись к видео в соцсетях.
 Не используй хэштеги. Не придумывай новых умений.
 """
-    text = _call_gemini(prompt, system)
+    return system, prompt
+
+
+HERO_POST_FALLBACK = "Есть крутой приём с героем {hero}! Смотри видео ниже 👇"
+
+
+def _hero_post_result(hero: str, text: str) -> str:
     if not text:
-        text = f"Есть крутой приём с героем {hero}! Смотри видео ниже 👇"
+        count_fallback("hero_post")
+        text = HERO_POST_FALLBACK.format(hero=hero)
     return text
 
+
+def generate_hero_post(hero: str, fresh: bool = False) -> str:
+    system, prompt = _hero_post_prompt(hero)
+    text = _call_gemini(prompt, system, kind="hero_post", fresh=fresh)
+    return _hero_post_result(hero, text)
+
+
+async def generate_hero_post_async(hero: str, fresh: bool = False) -> str:
+    system, prompt = _hero_post_prompt(hero)
+    text = await _call_gemini_async(prompt, system, kind="hero_post", fresh=fresh)
+    return _hero_post_result(hero, text)
+
 # ===== Counter-pick Q&A =====
 
 
-def generate_counter_pick(enemy: str, lane: Optional[str] = None, role: Optional[str] = None) -> str:
-    system = "Ты — эксперт по MLBB. Даёшь практичные советы и контр-пики на русском языке."
+def _counter_pick_prompt(enemy: str, lane: Optional[str], role: Optional[str]) -> Tuple[str, str]:
+    system = SYSTEM_COUNTER_PICK
     prompt = f"""
 Вопрос: как контрить героя {enemy} в MLBB?
 Укажи 3–6 контр-пиков (герои), по 1–2 ключевых совета против него и 1–2 предмета/эмблемы/боевых заклинаний, которые особенно полезны.
@@ -54,16 +368,46 @@ def generate_counter_pick(enemy: str, lane: Optional[str] = None, role: Optional
 
 Формат ответа: короткие маркированные пункты (— ...). Без хэштегов. Без выдуманных умений.
 """
-    text = _call_gemini(prompt, system)
+    return system, prompt
+
+
+def _counter_pick_fallback(enemy: str) -> str:
+    return f"Против {enemy} старайся пикать героев с жёстким контролем и сохраняй важные умения на её вход. Анти-хилл и прерывание — ключевые инструменты."
+
+
+def _counter_pick_result(enemy: str, text: str) -> str:
     if not text:
-        text = f"Против {enemy} старайся пикать героев с жёстким контролем и сохраняй важные умения на её вход. Анти-хилл и прерывание — ключевые инструменты."
+        count_fallback("counter_pick")
+        text = _counter_pick_fallback(enemy)
     return text
 
+
+def is_fallback_counter_pick(enemy: str, text: str) -> bool:
+    return text == _counter_pick_fallback(enemy)
+
+
+def generate_counter_pick(enemy: str, lane: Optional[str] = None, role: Optional[str] = None, fresh: bool = False) -> str:
+    system, prompt = _counter_pick_prompt(enemy, lane, role)
+    text = _call_gemini(prompt, system, kind="counter_pick", fresh=fresh)
+    return _counter_pick_result(enemy, text)
+
+
+async def generate_counter_pick_async(enemy: str, lane: Optional[str] = None, role: Optional[str] = None, fresh: bool = False) -> str:
+    system, prompt = _counter_pick_prompt(enemy, lane, role)
+    text = await _call_gemini_async(prompt, system, kind="counter_pick", fresh=fresh)
+    return _counter_pick_result(enemy, text)
+
+
+def stream_counter_pick(enemy: str, lane: Optional[str] = None, role: Optional[str] = None, fresh: bool = False) -> AsyncIterator[str]:
+    system, prompt = _counter_pick_prompt(enemy, lane, role)
+    chunks = _stream_gemini_async(prompt, system, kind="counter_pick", fresh=fresh)
+    return _stream_with_fallback(chunks, "counter_pick", _counter_pick_fallback(enemy))
+
 # ===== Tier List =====
 
 
-def generate_tier_list(role: Optional[str] = None, lane: Optional[str] = None, skill: Optional[str] = None, note: Optional[str] = None) -> Dict:
-    system = "Ты — аналитик MLBB. Формируешь tier list в JSON для Telegram Mini App."
+def _tier_list_prompt(role: Optional[str], lane: Optional[str], skill: Optional[str], note: Optional[str]) -> Tuple[str, str]:
+    system = SYSTEM_TIER_LIST
     prompt = f"""
 Сформируй актуальный tier list по MLBB в JSON с ключами: "S", "A", "B" (массивы имён героев) и "notes" (строка).
 {f"Роль/класс: {role}" if role else ""}
@@ -74,7 +418,10 @@ def generate_tier_list(role: Optional[str] = None, lane: Optional[str] = None, s
 Возвращай ТОЛЬКО валидный JSON, без пояснений, вроде:
 {{"S":["...","..."],"A":["..."],"B":["..."],"notes":"..."}}
 """
-    raw = _call_gemini(prompt, system)
+    return system, prompt
+
+
+def _tier_list_result(raw: str) -> Dict:
     import json
     try:
         data = json.loads(raw)
@@ -85,13 +432,34 @@ def generate_tier_list(role: Optional[str] = None, lane: Optional[str] = None, s
         return data
     except Exception:
         # fallback: простой список
+        count_fallback("tier_list")
         return {"S": [], "A": [], "B": [], "notes": raw or "Не удалось распарсить JSON."}
 
+
+def generate_tier_list(role: Optional[str] = None, lane: Optional[str] = None, skill: Optional[str] = None, note: Optional[str] = None, fresh: bool = False) -> Dict:
+    system, prompt = _tier_list_prompt(role, lane, skill, note)
+    raw = _call_gemini(prompt, system, kind="tier_list", fresh=fresh)
+    return _tier_list_result(raw)
+
+
+async def generate_tier_list_async(role: Optional[str] = None, lane: Optional[str] = None, skill: Optional[str] = None, note: Optional[str] = None, fresh: bool = False) -> Dict:
+    system, prompt = _tier_list_prompt(role, lane, skill, note)
+    raw = await _call_gemini_async(prompt, system, kind="tier_list", fresh=fresh)
+    return _tier_list_result(raw)
+
 # ===== Quiz =====
 
 
-def generate_quiz(topic: Optional[str] = None, difficulty: str = "easy") -> Dict:
-    system = "Ты — тренер MLBB. Генерируешь тестовые вопросы (multiple choice) на русском."
+QUIZ_FALLBACK: Dict = {
+    "question": "Что даёт предмет 'Necklace of Durance'?",
+    "options": ["Анти-хилл", "Щит", "Скорость атаки", "Вампиризм"],
+    "correct_index": 0,
+    "explanation": "Предмет снижает лечение противника (anti-heal).",
+}
+
+
+def _quiz_prompt(topic: Optional[str], difficulty: str) -> Tuple[str, str]:
+    system = SYSTEM_QUIZ
     prompt = f"""
 Сгенерируй один вопрос викторины по MLBB на русском.
 Тема: {topic or "общие механики, герои, предметы"}.
@@ -105,41 +473,168 @@ def generate_quiz(topic: Optional[str] = None, difficulty: str = "easy") -> Dict
 }}
 Без дополнительного текста — только JSON.
 """
-    raw = _call_gemini(prompt, system)
+    return system, prompt
+
+
+def _valid_quiz(item) -> Optional[Dict]:
+    # один вопрос: текст, ровно 4 непустых варианта, индекс ответа 0..3
+    if not isinstance(item, dict):
+        return None
+    question = item.get("question")
+    options = item.get("options")
+    if not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4:
+        return None
+    if not all(isinstance(o, str) and o.strip() for o in options):
+        return None
+    try:
+        correct_index = int(item.get("correct_index"))
+    except (TypeError, ValueError):
+        return None
+    if not 0 <= correct_index <= 3:
+        return None
+    explanation = item.get("explanation")
+    return {
+        "question": question.strip(),
+        "options": [o.strip() for o in options],
+        "correct_index": correct_index,
+        "explanation": explanation.strip() if isinstance(explanation, str) else None,
+    }
+
+
+def _quiz_result(raw: str) -> Dict:
     import json
     try:
-        data = json.loads(raw)
-        # валидация
-        if not isinstance(data.get("options"), list) or len(data["options"]) != 4:
-            raise ValueError("need 4 options")
+        data = _valid_quiz(json.loads(raw))
+        if data is None:
+            raise ValueError("invalid quiz")
         return data
     except Exception:
         # fallback
-        return {
-            "question": "Что даёт предмет 'Necklace of Durance'?",
-            "options": ["Анти-хилл", "Щит", "Скорость атаки", "Вампиризм"],
-            "correct_index": 0,
-            "explanation": "Предмет снижает лечение противника (anti-heal).",
-        }
+        count_fallback("quiz")
+        return dict(QUIZ_FALLBACK)
+
+
+def is_fallback_quiz(data: Dict) -> bool:
+    return data.get("question") == QUIZ_FALLBACK["question"]
+
+
+def generate_quiz(topic: Optional[str] = None, difficulty: str = "easy") -> Dict:
+    system, prompt = _quiz_prompt(topic, difficulty)
+    raw = _call_gemini(prompt, system, kind="quiz")
+    return _quiz_result(raw)
+
+
+async def generate_quiz_async(topic: Optional[str] = None, difficulty: str = "easy") -> Dict:
+    system, prompt = _quiz_prompt(topic, difficulty)
+    raw = await _call_gemini_async(prompt, system, kind="quiz")
+    return _quiz_result(raw)
+
+
+def _quizzes_prompt(n: int, topic: Optional[str], difficulty: str) -> Tuple[str, str]:
+    system = SYSTEM_QUIZ
+    prompt = f"""
+Сгенерируй {n} разных вопросов викторины по MLBB на русском. Вопросы не должны повторяться.
+Тема: {topic or "общие механики, герои, предметы"}.
+Сложность: {difficulty}.
+Формат ответа строго JSON-массив из {n} объектов:
+[
+  {{
+    "question": "Текст вопроса?",
+    "options": ["Вариант 1","Вариант 2","Вариант 3","Вариант 4"],
+    "correct_index": 0,
+    "explanation": "Короткое объяснение, почему ответ верный."
+  }}
+]
+Без дополнительного текста — только JSON.
+"""
+    return system, prompt
+
+
+def _quizzes_result(raw: str, n: int) -> List[Dict]:
+    # каждый вопрос проверяем отдельно: битые выбрасываем, годные оставляем
+    import json
+    text = (raw or "").strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+    except Exception:
+        data = None
+    if isinstance(data, dict):
+        data = data.get("questions")
+    good: List[Dict] = []
+    seen = set()
+    for item in data if isinstance(data, list) else []:
+        quiz = _valid_quiz(item)
+        if quiz is None or quiz["question"].lower() in seen:
+            continue
+        seen.add(quiz["question"].lower())
+        good.append(quiz)
+        if len(good) == n:
+            break
+    if not good:
+        count_fallback("quiz")
+        return [dict(QUIZ_FALLBACK)]
+    return good
+
+
+def generate_quizzes(n: int, topic: Optional[str] = None, difficulty: str = "easy") -> List[Dict]:
+    n = max(1, min(n, QUIZ_BATCH_MAX))
+    system, prompt = _quizzes_prompt(n, topic, difficulty)
+    raw = _call_gemini(prompt, system, kind="quiz_batch")
+    return _quizzes_result(raw, n)
+
+
+async def generate_quizzes_async(n: int, topic: Optional[str] = None, difficulty: str = "easy") -> List[Dict]:
+    n = max(1, min(n, QUIZ_BATCH_MAX))
+    system, prompt = _quizzes_prompt(n, topic, difficulty)
+    raw = await _call_gemini_async(prompt, system, kind="quiz_batch")
+    return _quizzes_result(raw, n)
 
 # ===== Daily Challenge =====
 
 
-def generate_daily_challenge() -> str:
-    system = "Ты — креативный менеджер MLBB. Придумываешь челленджи для игроков."
+def _daily_challenge_prompt(avoid: Optional[List[str]] = None) -> Tuple[str, str]:
+    system = SYSTEM_DAILY
     prompt = """
 Придумай один ежедневный челлендж для MLBB на русском.
 Формат: 1–2 предложения, конкретная цель, без хэштегов.
 Примеры: "Выиграй матч, купив хотя бы 3 защитных предмета"; "Сыграй без Recall"; "Сделай 3 успешных ганка до 7 минуты".
 """
-    text = _call_gemini(prompt, system)
-    return text or "Выиграй матч, не умирая более 2 раз!"
+    if avoid:
+        # при генерации на несколько дней вперёд — чтобы дни не повторялись
+        prompt += "Не повторяй эти челленджи:\n" + "\n".join(f"- {t}" for t in avoid) + "\n"
+    return system, prompt
+
+
+DAILY_FALLBACK = "Выиграй матч, не умирая более 2 раз!"
+
+
+def _daily_challenge_result(text: str) -> str:
+    if not text:
+        count_fallback("daily")
+        text = DAILY_FALLBACK
+    return text
+
+
+def generate_daily_challenge() -> str:
+    system, prompt = _daily_challenge_prompt()
+    text = _call_gemini(prompt, system, kind="daily")
+    return _daily_challenge_result(text)
+
+
+async def generate_daily_challenge_async(avoid: Optional[List[str]] = None) -> str:
+    system, prompt = _daily_challenge_prompt(avoid)
+    text = await _call_gemini_async(prompt, system, kind="daily")
+    return _daily_challenge_result(text)
 
 # ===== Patch Explainer =====
 
 
-def explain_patch(notes_text: str) -> str:
-    system = "Ты — аналитик патчноутов MLBB. Объясняешь изменения простым языком."
+def _patch_prompt(notes_text: str) -> Tuple[str, str]:
+    system = SYSTEM_PATCH
     prompt = f"""
 Вот текст патчноутов (могут быть сокращены или сырыми):
 
@@ -147,5 +642,32 @@ def explain_patch(notes_text: str) -> str:
 
 Сделай краткое объяснение по пунктам: кто усилен/ослаблен, ключевые изменения предметов/эмблем, что это значит для меты. Пиши по-русски, списком из 5–10 пунктов.
 """
-    text = _call_gemini(prompt, system)
-    return text or "Нет явных изменений."
+    return system, prompt
+
+
+PATCH_FALLBACK = "Нет явных изменений."
+
+
+def _patch_result(text: str) -> str:
+    if not text:
+        count_fallback("patch_explain")
+        text = PATCH_FALLBACK
+    return text
+
+
+def explain_patch(notes_text: str, fresh: bool = False) -> str:
+    system, prompt = _patch_prompt(notes_text)
+    text = _call_gemini(prompt, system, kind="patch_explain", fresh=fresh)
+    return _patch_result(text)
+
+
+async def explain_patch_async(notes_text: str, fresh: bool = False) -> str:
+    system, prompt = _patch_prompt(notes_text)
+    text = await _call_gemini_async(prompt, system, kind="patch_explain", fresh=fresh)
+    return _patch_result(text)
+
+
+def stream_patch_explanation(notes_text: str, fresh: bool = False) -> AsyncIterator[str]:
+    system, prompt = _patch_prompt(notes_text)
+    chunks = _stream_gemini_async(prompt, system, kind="patch_explain", fresh=fresh)
+    return _stream_with_fallback(chunks, "patch_explain", PATCH_FALLBACK)
@@ -1,56 +1,78 @@
 # backend/app.py
 
 import os
-import random
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-from typing import List, Optional, Literal
-from pathlib import Path
+from typing import List, Optional, Literal, AsyncIterator
+import importlib.util
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from dotenv import load_dotenv
+from pydantic import BaseModel, Field
 import hmac
 import hashlib
-from urllib.parse import parse_qs
-
-from heroes import HEROES
-from db import (
-    init_db, get_used_heroes, mark_hero_used,
-    save_quiz, get_quiz,
-    save_daily_challenge, get_daily_challenge,
-    list_quizzes, get_db_path,
-)
-from ai_client import (
-    generate_hero_post,
-    generate_counter_pick,
-    generate_tier_list,
-    generate_quiz,
-    generate_daily_challenge,
-    explain_patch,
-)
+import json
 
 # ---------------------------
 # 1) Загрузка .env (надёжно)
 # ---------------------------
-
-
-def load_env():
-    candidates = [
-        Path(__file__).parent / ".env",          # backend/.env
-        Path.cwd() / ".env",                      # текущая папка запуска
-        Path(__file__).parent.parent / ".env",    # корень проекта
-    ]
-    for p in candidates:
-        if p.exists():
-            load_dotenv(dotenv_path=p, override=True)
-            print(f"[ENV] loaded {p}")
-            return
-    print("[ENV] .env not found in", candidates)
-
+# до импорта модулей проекта: они читают настройки (GEMINI_API_KEY, DB_PATH, ...) при импорте
+from env import load_env
 
 load_env()
 
+from heroes import HEROES
+from db import (
+    init_db, async_engine,
+    save_quiz_async, save_quizzes_async, get_quiz_async, get_quizzes_async, list_quiz_history_async,
+    list_leaderboard_async,
+    save_daily_challenge_async, get_daily_challenge_async,
+    list_quizzes, get_db_path, get_sqlite_settings,
+)
+from ai_client import (
+    generate_hero_post_async,
+    generate_quiz_async,
+    generate_quizzes_async,
+    is_fallback_quiz,
+    QUIZ_BATCH_MAX,
+    generate_daily_challenge_async,
+    explain_patch_async,
+    stream_patch_explanation,
+    StreamInterrupted,
+    AI_CACHE_TTLS,
+    GEMINI_MODEL,
+    GEMINI_MAX_CONCURRENCY,
+    gemini_slot_stats,
+    get_model,
+    warm_up_models_async,
+    gemini_breaker,
+    AI_DEADLINES,
+)
+from ai_cache import response_cache
+from singleflight import inflight
+from quiz_pool import quiz_pool, normalize_topic
+from quiz_answers import answer_recorder
+from daily_schedule import daily_schedule, utc_day
+from counter_picks import counter_pick_table
+from tier_cache import tier_list_cache
+from hero_rotation import hero_rotation
+# индекс канала не зависит от googleapiclient: stop() в lifespan безопасен и без YouTube
+from channel_index import channel_index
+from tg_auth import (
+    verify_init_data,
+    init_data_user,
+    issue_session,
+    tg_session,
+    require_tg_session,
+    verified_cache,
+    TG_AUTH_MAX_AGE,
+    TG_SESSION_TTL,
+    TG_REQUIRE_SESSION,
+)
+from metrics import MetricsMiddleware, render_latest
+
 # делаем YouTube переменные необязательными (мы договорились вернуться к ним позже)
 if not os.getenv("GEMINI_API_KEY"):
     print("[WARN] GEMINI_API_KEY is not set — AI responses will use safe fallbacks.")
@@ -58,7 +80,43 @@ if not os.getenv("GEMINI_API_KEY"):
 # ---------------------------
 # 2) Создаём приложение + CORS
 # ---------------------------
-app = FastAPI(title="MLBB Mini App API", version="0.2.0")
+# true — прогреть Gemini до приёма запросов; background — после старта, не задерживая /health; false — при первом вызове
+AI_WARMUP = os.getenv("AI_WARMUP", "background").lower()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await asyncio.to_thread(init_db)
+    warmup = None
+    if AI_WARMUP in ("1", "true", "yes"):
+        await warm_up_models_async()
+    elif AI_WARMUP == "background":
+        warmup = asyncio.ensure_future(warm_up_models_async())
+    await hero_rotation.load_async()
+    await counter_pick_table.load_async()
+    await tier_list_cache.load_async()
+    await daily_schedule.load_async()
+    quiz_pool.start()
+    counter_pick_table.start()
+    answer_recorder.start()
+    daily_schedule.start()
+    if HAS_YT and os.getenv("YOUTUBE_API_KEY") and os.getenv("YOUTUBE_CHANNEL_ID"):
+        await asyncio.to_thread(channel_index.load)
+        channel_index.start(sync_channel_videos)
+    yield
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await channel_index.stop()
+    await daily_schedule.stop()
+    await answer_recorder.stop()
+    await quiz_pool.stop()
+    await counter_pick_table.stop()
+    await tier_list_cache.stop()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="MLBB Mini App API", version="0.2.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
 app.add_middleware(
@@ -70,9 +128,61 @@ app.add_middleware(
 )
 
 # ---------------------------
-# 3) Инициализируем БД
+# 2.1) Админ-доступ
+# ---------------------------
+# Если ADMIN_TOKEN задан — /admin/* требуют заголовок X-Admin-Token.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def _is_admin(x_admin_token: Optional[str]) -> bool:
+    return not ADMIN_TOKEN or hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not _is_admin(x_admin_token):
+        raise HTTPException(403, "Admin token required")
+
+
+def admin_flag(x_admin_token: Optional[str] = Header(None)) -> bool:
+    return _is_admin(x_admin_token)
+
+
+def mini_app_session(session: Optional[dict] = Depends(tg_session),
+                     x_admin_token: Optional[str] = Header(None)) -> Optional[dict]:
+    # все маршруты Mini App: присланный токен проверяется всегда (битый/истёкший — 401),
+    # при TG_REQUIRE_SESSION без него пускаем только скрипты с X-Admin-Token
+    if session is None and TG_REQUIRE_SESSION and not (ADMIN_TOKEN and _is_admin(x_admin_token)):
+        raise HTTPException(401, "Session token required: call /tg/verify first")
+    return session
+
+
+def _fresh(requested: bool, is_admin: bool) -> bool:
+    # fresh идёт мимо кэша и singleflight — каждый раз платный вызов Gemini: только для админа
+    if requested and not is_admin:
+        raise HTTPException(403, "fresh=true requires admin token")
+    return requested
+
+# ---------------------------
+# 3) HTTP-кэширование (ETag / 304)
 # ---------------------------
-init_db()
+# вопрос после сохранения не меняется, но id может достаться другому вопросу после сброса БД —
+# поэтому срок ограничен, а ETag считается от содержимого строки
+QUIZ_CACHE_CONTROL = os.getenv("QUIZ_CACHE_CONTROL", "public, max-age=86400")
+# no-cache: хранить можно, но перед использованием — сверить ETag
+HEROES_CACHE_CONTROL = os.getenv("HEROES_CACHE_CONTROL", "no-cache")
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # слабое сравнение, как требует RFC 9110 для If-None-Match
+    return etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+
+
+def _not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
 
 # ---------------------------
 # 4) Pydantic схемы
@@ -83,9 +193,25 @@ class HeroPick(BaseModel):
     hero: str
 
 
+class MarkUsedReq(BaseModel):
+    hero: str
+    reservation_id: Optional[str] = None  # токен из /heroes/reserve
+
+
+class ReleaseReq(BaseModel):
+    reservation_id: str  # из /heroes/reserve, /post/compose или /post/compose-batch
+
+
+class HeroReserveResponse(BaseModel):
+    hero: str
+    reservation_id: str
+    expires_at: float
+
+
 class HeroPostRequest(BaseModel):
     hero: str
     video_url: str
+    fresh: bool = False  # True — мимо кэша, сгенерировать заново (только с X-Admin-Token)
 
 
 class ComposeRequest(BaseModel):
@@ -98,12 +224,23 @@ class ComposeResponse(BaseModel):
     video_title: str
     video_url: str
     post_text: str
+    text_fallback: bool = False  # Gemini не успел к дедлайну — запасной текст
+    reservation_id: Optional[str] = None  # передать в /heroes/mark-used при публикации
+
+
+# сколько черновиков собирает /post/compose-batch за раз (неделя постов)
+POST_COMPOSE_BATCH_MAX = int(os.getenv("POST_COMPOSE_BATCH_MAX", "7"))
+
+
+class ComposeBatchReq(BaseModel):
+    n: int = Field(7, ge=1, le=POST_COMPOSE_BATCH_MAX)
 
 
 class CounterPickReq(BaseModel):
     enemy: str
     lane: Optional[str] = None
     role: Optional[str] = None
+    fresh: bool = False
 
 
 class TierListReq(BaseModel):
@@ -111,6 +248,7 @@ class TierListReq(BaseModel):
     lane: Optional[str] = None
     skill: Optional[str] = None     # e.g., "Legend+", "Mythic"
     note: Optional[str] = None
+    fresh: bool = False
 
 
 class QuizGenReq(BaseModel):
@@ -119,29 +257,80 @@ class QuizGenReq(BaseModel):
     difficulty: Literal["easy", "medium", "hard"] = "easy"
 
 
-class QuizCheckReq(BaseModel):
+class QuizBatchGenReq(QuizGenReq):
+    n: int = Field(5, ge=1, le=QUIZ_BATCH_MAX)
+
+
+class QuizAnswer(BaseModel):
     quiz_id: int
     answer_index: int
 
 
+class QuizCheckReq(QuizAnswer):
+    # initData из Telegram Mini App: если передан — ответ идёт в рейтинг пользователя
+    init_data: Optional[str] = None
+
+
+QUIZ_CHECK_BATCH_MAX = int(os.getenv("QUIZ_CHECK_BATCH_MAX", "50"))
+
+
+class QuizCheckBatchReq(BaseModel):
+    answers: List[QuizAnswer] = Field(..., min_length=1, max_length=QUIZ_CHECK_BATCH_MAX)
+    init_data: Optional[str] = None
+
+
 class PatchReq(BaseModel):
     notes_text: str
+    fresh: bool = False
 
 # ---------------------------
 # 5) Служебные/диагностические
 # ---------------------------
 
 
+def _sse_response(chunks: AsyncIterator[str]) -> StreamingResponse:
+    # события: "data: {"text": кусок}" по мере генерации, в конце "event: done" с полным текстом;
+    # если Gemini оборвался посреди ответа — "event: error" вместо done
+    import json
+
+    async def events():
+        parts: List[str] = []
+        try:
+            async for piece in chunks:
+                parts.append(piece)
+                yield f"data: {json.dumps({'text': piece}, ensure_ascii=False)}\n\n"
+        except StreamInterrupted as e:
+            print("[ERROR] stream:", e)
+            yield f"event: error\ndata: {json.dumps({'error': 'AI answer was interrupted'})}\n\n"
+            return
+        full = "".join(parts).strip()
+        yield f"event: done\ndata: {json.dumps({'text': full}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/debug/env")
 def debug_env():
     return {
         "gemini_model": os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
         "gemini_key_set": bool(os.getenv("GEMINI_API_KEY")),
+        "gemini_max_concurrency": GEMINI_MAX_CONCURRENCY,
+        "gemini_breaker": gemini_breaker.stats()["state"],
         "youtube_key_set": bool(os.getenv("YOUTUBE_API_KEY")),
         "youtube_channel_id": os.getenv("YOUTUBE_CHANNEL_ID"),
         "cors_origins": [o.strip() for o in origins if o.strip()],
@@ -149,12 +338,18 @@ def debug_env():
     }
 
 
+@app.get("/debug/ai-breaker")
+def debug_ai_breaker():
+    return {**gemini_breaker.stats(), "deadlines": AI_DEADLINES, "slots": gemini_slot_stats()}
+
+
 @app.get("/debug/db")
 def debug_db():
     try:
         last = list_quizzes(limit=5)
         return {
             "db_path": get_db_path(),
+            "sqlite": get_sqlite_settings(),
             "last_quizzes": [
                 {"id": q.id, "question": q.question} for q in last
             ],
@@ -163,32 +358,47 @@ def debug_db():
         print("[ERROR] /debug/db:", e)
         raise HTTPException(500, "DB diagnostics failed")
 
+
+@app.get("/debug/ai-cache")
+def debug_ai_cache():
+    return {**response_cache.stats(), "ttls": AI_CACHE_TTLS, "single_flight": inflight.stats()}
+
+
+@app.post("/debug/ai-cache/clear", dependencies=[Depends(require_admin)])
+def debug_ai_cache_clear(kind: Optional[str] = None):
+    try:
+        removed = response_cache.clear(kind)
+        return {"ok": True, "removed": removed}
+    except Exception as e:
+        print("[ERROR] /debug/ai-cache/clear:", e)
+        raise HTTPException(500, "Cache clear failed")
+
 # ---------------------------
 # 6) Герои: остаток/пик/маркировка
 # ---------------------------
 
 
-@app.get("/heroes/remaining")
-def heroes_remaining():
+@app.get("/heroes/remaining", dependencies=[Depends(mini_app_session)])
+def heroes_remaining(if_none_match: Optional[str] = Header(None)):
+    # меняется только при записи в ротацию: клиент/CDN переспрашивают с If-None-Match и получают 304
     try:
-        used: List[str] = get_used_heroes()
-        used_set = set(used)
-        remain = [h for h in HEROES if h not in used_set]
-        return {"remaining": remain, "used_count": len(used_set), "total": len(HEROES)}
+        etag = f'"heroes-{hero_rotation.version()}"'
+        if _etag_matches(if_none_match, etag):
+            return _not_modified(etag, HEROES_CACHE_CONTROL)
+        counts = hero_rotation.counts()
+        body = {"remaining": list(hero_rotation.remaining()), "used_count": counts["used"], "total": counts["total"]}
+        return JSONResponse(body, headers={"ETag": etag, "Cache-Control": HEROES_CACHE_CONTROL})
     except Exception as e:
         print("[ERROR] /heroes/remaining:", e)
         raise HTTPException(500, "Failed to read heroes from DB")
 
 
-@app.post("/heroes/pick", response_model=HeroPick)
+@app.post("/heroes/pick", response_model=HeroPick, dependencies=[Depends(mini_app_session)])
 def pick_hero():
     try:
-        used: List[str] = get_used_heroes()
-        used_set = set(used)
-        remaining = [h for h in HEROES if h not in used_set]
-        if not remaining:
+        hero = hero_rotation.pick()
+        if not hero:
             raise HTTPException(409, "All heroes used. Reset needed.")
-        hero = random.choice(remaining)
         return {"hero": hero}
     except HTTPException:
         raise
@@ -197,25 +407,70 @@ def pick_hero():
         raise HTTPException(500, "DB error")
 
 
-@app.post("/heroes/mark-used")
-def mark_used(body: HeroPick):
+@app.post("/heroes/reserve", response_model=HeroReserveResponse, dependencies=[Depends(mini_app_session)])
+async def reserve_hero():
+    try:
+        r = await hero_rotation.reserve_async()
+        if r is None:
+            raise HTTPException(409, "All heroes used or reserved. Reset needed.")
+        return {"hero": r.hero, "reservation_id": r.token, "expires_at": r.expires_at}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("[ERROR] /heroes/reserve:", e)
+        raise HTTPException(500, "DB error")
+
+
+@app.post("/heroes/mark-used", dependencies=[Depends(mini_app_session)])
+async def mark_used(body: MarkUsedReq, x_admin_token: Optional[str] = Header(None)):
+    # с reservation_id — публикация своей брони; админ без токена снимает любую бронь героя
+    # (старый поток публикации: бронь от /post/compose не даёт 409)
+    override = body.reservation_id is None and _is_admin(x_admin_token)
     try:
         ts = datetime.now(timezone.utc).isoformat()
-        mark_hero_used(body.hero, ts)
-        return {"ok": True, "hero": body.hero, "posted_at": ts}
+        status = await hero_rotation.mark_used_async(body.hero, ts, body.reservation_id, override)
     except Exception as e:
         print("[ERROR] /heroes/mark-used:", e)
         raise HTTPException(500, "DB error")
+    if status == "used":
+        raise HTTPException(409, f"Hero {body.hero} is already used")
+    if status == "reserved":
+        raise HTTPException(409, f"Hero {body.hero} is reserved by another post")
+    return {"ok": True, "hero": body.hero, "posted_at": ts}
+
+
+@app.post("/heroes/release", dependencies=[Depends(mini_app_session)])
+async def release_hero(body: ReleaseReq):
+    # черновик отброшен — герой возвращается в ротацию, не дожидаясь конца брони
+    try:
+        hero = await hero_rotation.release_async(body.reservation_id)
+    except Exception as e:
+        print("[ERROR] /heroes/release:", e)
+        raise HTTPException(500, "DB error")
+    if hero is None:
+        raise HTTPException(404, "Reservation not found")
+    return {"ok": True, "hero": hero}
+
+
+@app.post("/heroes/reset", dependencies=[Depends(require_admin)])
+async def heroes_reset():
+    try:
+        await hero_rotation.reset_async()
+        return {"ok": True, "total": len(HEROES)}
+    except Exception as e:
+        print("[ERROR] /heroes/reset:", e)
+        raise HTTPException(500, "DB error")
 
 # ---------------------------
 # 7) Пост от ИИ (только текст)
 # ---------------------------
 
 
-@app.post("/ai/hero-post")
-def ai_hero_post(body: HeroPostRequest):
+@app.post("/ai/hero-post", dependencies=[Depends(mini_app_session)])
+async def ai_hero_post(body: HeroPostRequest, is_admin: bool = Depends(admin_flag)):
+    fresh = _fresh(body.fresh, is_admin)
     try:
-        text = generate_hero_post(body.hero)
+        text = await generate_hero_post_async(body.hero, fresh=fresh)
         return {"hero": body.hero, "post_text": f"{text}\n{body.video_url}"}
     except Exception as e:
         print("[ERROR] /ai/hero-post:", e)
@@ -226,99 +481,312 @@ def ai_hero_post(body: HeroPostRequest):
 # ---------------------------
 
 
-@app.post("/ai/counter-pick")
-def ai_counter_pick(body: CounterPickReq):
-    text = generate_counter_pick(body.enemy, body.lane, body.role)
+@app.post("/ai/counter-pick", dependencies=[Depends(mini_app_session)])
+async def ai_counter_pick(body: CounterPickReq, is_admin: bool = Depends(admin_flag)):
+    # сначала предрасчитанная таблица, Gemini — только для новых сочетаний
+    text = await counter_pick_table.answer(
+        body.enemy, body.lane, body.role, fresh=_fresh(body.fresh, is_admin))
     return {"enemy": body.enemy, "answer": text}
 
+
+@app.post("/ai/counter-pick/stream", dependencies=[Depends(mini_app_session)])
+async def ai_counter_pick_stream(body: CounterPickReq, is_admin: bool = Depends(admin_flag)):
+    return _sse_response(counter_pick_table.answer_stream(
+        body.enemy, body.lane, body.role, fresh=_fresh(body.fresh, is_admin)))
+
+
+class CounterPickRefreshReq(BaseModel):
+    full: bool = False  # True — пересчитать всё (например, вышел патч)
+
+
+@app.post("/admin/counter-picks/refresh", dependencies=[Depends(require_admin)])
+async def admin_counter_picks_refresh(body: CounterPickRefreshReq):
+    started = counter_pick_table.start_refresh(full=body.full)
+    return {"ok": True, "started": started, **counter_pick_table.stats()}
+
+
+@app.get("/debug/counter-picks")
+def debug_counter_picks():
+    return counter_pick_table.stats()
+
 # ---------------------------
 # 9) Tier List
 # ---------------------------
 
 
-@app.post("/ai/tier-list")
-def ai_tier_list(body: TierListReq):
-    data = generate_tier_list(
-        role=body.role, lane=body.lane, skill=body.skill, note=body.note
+@app.post("/ai/tier-list", dependencies=[Depends(mini_app_session)])
+async def ai_tier_list(body: TierListReq, is_admin: bool = Depends(admin_flag)):
+    # устаревший список отдаётся сразу, свежий генерируется в фоне
+    data = await tier_list_cache.get(
+        role=body.role, lane=body.lane, skill=body.skill, note=body.note,
+        fresh=_fresh(body.fresh, is_admin),
     )
     return data
 
+
+@app.post("/admin/tier-list/invalidate", dependencies=[Depends(require_admin)])
+async def admin_tier_list_invalidate():
+    # вышел патч — все сохранённые tier list'ы больше не актуальны
+    try:
+        removed = await tier_list_cache.invalidate_all()
+        return {"ok": True, "removed": removed}
+    except Exception as e:
+        print("[ERROR] /admin/tier-list/invalidate:", e)
+        raise HTTPException(500, "Invalidate failed")
+
+
+@app.get("/debug/tier-list")
+def debug_tier_list():
+    return tier_list_cache.stats()
+
 # ---------------------------
 # 10) Quiz: generate + check
 # ---------------------------
 
 
-@app.post("/quiz/generate")
-def quiz_generate(body: QuizGenReq):
-    data = generate_quiz(topic=body.topic, difficulty=body.difficulty)
-    quiz_id = save_quiz(
+@app.post("/quiz/generate", dependencies=[Depends(mini_app_session)])
+async def quiz_generate(body: QuizGenReq):
+    topic = normalize_topic(body.topic)
+    pooled = await quiz_pool.take(topic, body.difficulty)
+    if pooled:
+        return pooled
+    # корзина пуста (или тема вне пула) — генерируем вживую
+    data = await generate_quiz_async(topic=body.topic, difficulty=body.difficulty)
+    quiz_id = await save_quiz_async(
         question=data["question"],
         options=data["options"],
         correct_index=int(data["correct_index"]),
         explanation=data.get("explanation"),
         created_at=datetime.now(timezone.utc).isoformat(),
+        topic=topic,
+        difficulty=body.difficulty,
     )
     return {"quiz_id": quiz_id, **data}
 
 
+@app.post("/quiz/batch-generate", dependencies=[Depends(mini_app_session)])
+async def quiz_batch_generate(body: QuizBatchGenReq):
+    # N вопросов одним вызовом Gemini; невалидные отброшены, годные — одной транзакцией
+    items = await generate_quizzes_async(body.n, topic=body.topic, difficulty=body.difficulty)
+    ids = await save_quizzes_async(
+        items,
+        created_at=datetime.now(timezone.utc).isoformat(),
+        topic=normalize_topic(body.topic),
+        difficulty=body.difficulty,
+    )
+    return {
+        "requested": body.n,
+        "generated": len(items),
+        "fallback": any(is_fallback_quiz(q) for q in items),
+        "quizzes": [{"quiz_id": quiz_id, **data} for quiz_id, data in zip(ids, items)],
+    }
+
+
+@app.get("/debug/quiz-pool")
+def debug_quiz_pool():
+    return quiz_pool.stats()
+
+
 @app.post("/quiz/check")
-def quiz_check(body: QuizCheckReq):
-    import json
-    q = get_quiz(body.quiz_id)
+async def quiz_check(body: QuizCheckReq, session: Optional[dict] = Depends(mini_app_session)):
+    user = _quiz_user(session, body.init_data)
+    q = await get_quiz_async(body.quiz_id)
     if not q:
         raise HTTPException(404, "Quiz not found")
-    options = json.loads(q.options_json)
-    correct = int(body.answer_index) == int(q.correct_index)
+    result = _check_answer(q, body.answer_index)
+    if user:
+        answer_recorder.record(*user, q.id, result["correct"])
+    return result
+
+
+def _quiz_user(session: Optional[dict], init_data: Optional[str]):
+    # (user_id, username) из сессии /tg/verify или, для старых клиентов, из подписанного initData;
+    # без бота/initData ответ просто не попадает в рейтинг
+    if session is not None:
+        return session["uid"], session.get("name")
+    if not init_data or not os.getenv("TELEGRAM_BOT_TOKEN"):
+        return None
+    user = init_data_user(verify_init_data(init_data))
+    if user is None:
+        return None
+    return int(user["id"]), user.get("username") or user.get("first_name")
+
+
+def _check_answer(q, answer_index: int) -> dict:
     return {
-        "correct": correct,
+        "correct": int(answer_index) == int(q.correct_index),
         "correct_index": q.correct_index,
         "explanation": q.explanation or "",
         "question": q.question,
-        "options": options,
+        "options": q.options,
+    }
+
+
+@app.post("/quiz/check-batch")
+async def quiz_check_batch(body: QuizCheckBatchReq, session: Optional[dict] = Depends(mini_app_session)):
+    # весь прогон квиза — один запрос и один SELECT ... WHERE id IN (...)
+    user = _quiz_user(session, body.init_data)
+    quizzes = await get_quizzes_async([a.quiz_id for a in body.answers])
+    results = []
+    for a in body.answers:
+        q = quizzes.get(a.quiz_id)
+        if q is None:
+            results.append({"quiz_id": a.quiz_id, "found": False, "correct": False})
+            continue
+        result = _check_answer(q, a.answer_index)
+        if user:
+            answer_recorder.record(*user, q.id, result["correct"])
+        results.append({"quiz_id": a.quiz_id, "found": True, **result})
+    return {
+        "total": len(results),
+        "correct_count": sum(1 for r in results if r["correct"]),
+        "results": results,
     }
 
 
-@app.get("/quiz/{quiz_id}")
-def quiz_get(quiz_id: int):
+@app.get("/quiz/leaderboard", dependencies=[Depends(mini_app_session)])
+async def quiz_leaderboard(limit: int = Query(10, ge=1, le=100)):
+    # читаем готовый агрегат QuizScore — сырые ответы не сканируются
+    rows = await list_leaderboard_async(limit)
+    return {
+        "items": [
+            {"rank": i, "username": r.username, "correct": r.correct, "answered": r.answered}
+            for i, r in enumerate(rows, start=1)
+        ],
+    }
+
+
+@app.get("/debug/quiz-answers")
+def debug_quiz_answers():
+    return answer_recorder.stats()
+
+
+QUIZ_HISTORY_MAX_LIMIT = int(os.getenv("QUIZ_HISTORY_MAX_LIMIT", "100"))
+
+
+def _encode_cursor(q) -> str:
+    import base64
+    import json
+    raw = json.dumps([q.created_at, q.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    import base64
     import json
-    q = get_quiz(quiz_id)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, quiz_id = json.loads(raw)
+        return str(created_at), int(quiz_id)
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+@app.get("/quiz/history", dependencies=[Depends(mini_app_session)])
+async def quiz_history(
+    limit: int = Query(20, ge=1, le=QUIZ_HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    difficulty: Optional[Literal["easy", "medium", "hard"]] = None,
+    topic: Optional[str] = None,
+):
+    # новые сверху; next_cursor — ключ последней строки, страница любой глубины стоит одинаково
+    before = _decode_cursor(cursor) if cursor else None
+    rows = await list_quiz_history_async(
+        limit=limit + 1,
+        before=before,
+        created_from=created_from,
+        created_to=created_to,
+        difficulty=difficulty,
+        topic=normalize_topic(topic),
+    )
+    page = rows[:limit]
+    return {
+        "items": [
+            {
+                "id": q.id,
+                "question": q.question,
+                "options": q.options,
+                "correct_index": q.correct_index,
+                "explanation": q.explanation or "",
+                "difficulty": q.difficulty,
+                "topic": q.topic,
+                "created_at": q.created_at,
+            }
+            for q in page
+        ],
+        "next_cursor": _encode_cursor(page[-1]) if len(rows) > limit else None,
+    }
+
+
+@app.get("/quiz/{quiz_id}", dependencies=[Depends(mini_app_session)])
+async def quiz_get(quiz_id: int, if_none_match: Optional[str] = Header(None)):
+    q = await get_quiz_async(quiz_id)
     if not q:
         raise HTTPException(404, "Quiz not found")
-    return {
+    body = {
         "id": q.id,
         "question": q.question,
-        "options": json.loads(q.options_json),
+        "options": q.options,
         "correct_index": q.correct_index,
         "explanation": q.explanation or "",
         "created_at": q.created_at,
     }
+    # ETag от содержимого: тот же id с другим вопросом (сброс БД, переиспользованный rowid) — другой тег
+    digest = hashlib.sha256(json.dumps(body, ensure_ascii=False, sort_keys=True).encode()).hexdigest()[:16]
+    etag = f'"quiz-{q.id}-{digest}"'
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag, QUIZ_CACHE_CONTROL)
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": QUIZ_CACHE_CONTROL})
 
 # ---------------------------
 # 11) Daily Challenge
 # ---------------------------
 
 
-@app.post("/daily/generate")
-def daily_generate():
-    today = datetime.now(timezone.utc).date().isoformat()
-    existing = get_daily_challenge(today)
+async def _daily_get_or_create(today: str) -> dict:
+    existing = await get_daily_challenge_async(today)
     if existing:
         return {"date": today, "text": existing.text, "cached": True}
-    text = generate_daily_challenge()
-    save_daily_challenge(today, text, datetime.now(timezone.utc).isoformat())
-    return {"date": today, "text": text, "cached": False}
+    text = await generate_daily_challenge_async()
+    saved = await save_daily_challenge_async(today, text, datetime.now(timezone.utc).isoformat())
+    return {"date": today, "text": saved.text, "cached": False}
+
+
+@app.post("/daily/generate", dependencies=[Depends(mini_app_session)])
+async def daily_generate():
+    today = utc_day()
+    # обычно день сгенерирован заранее и лежит в памяти — без SQLite и Gemini
+    text = daily_schedule.get(today)
+    if text is not None:
+        return {"date": today, "text": text, "cached": True}
+    # планировщик не успел (Gemini лежал, только что стартовали) — первые вызовы делят одну генерацию
+    result = await inflight.do(f"daily:{today}", lambda: _daily_get_or_create(today))
+    daily_schedule.remember(today, result["text"])
+    return result
+
+
+@app.get("/debug/daily")
+def debug_daily():
+    return daily_schedule.stats()
 
 # ---------------------------
 # 12) Patch Explainer
 # ---------------------------
 
 
-@app.post("/ai/patch-explain")
-def ai_patch_explain(body: PatchReq):
-    text = explain_patch(body.notes_text)
+@app.post("/ai/patch-explain", dependencies=[Depends(mini_app_session)])
+async def ai_patch_explain(body: PatchReq, is_admin: bool = Depends(admin_flag)):
+    text = await explain_patch_async(body.notes_text, fresh=_fresh(body.fresh, is_admin))
     return {"summary": text}
 
 
+@app.post("/ai/patch-explain/stream", dependencies=[Depends(mini_app_session)])
+async def ai_patch_explain_stream(body: PatchReq, is_admin: bool = Depends(admin_flag)):
+    return _sse_response(stream_patch_explanation(body.notes_text, fresh=_fresh(body.fresh, is_admin)))
+
+
 # ---------------------------
 # 13) (опционально) YouTube — вернёмся позже
 # ---------------------------
@@ -328,112 +796,108 @@ try:
         find_video_for_hero,
         youtube_ping_global,
         youtube_channel_ping,
+        quota_stats as youtube_quota_stats,
+        sync_channel_videos,
+        QuotaExhausted,
     )
-    HAS_YT = True
+    from post_composer import compose_post_async, compose_batch_async, NoVideoFound, ComposeTimeout
+    # сам googleapiclient грузится лениво — проверяем только, что он установлен
+    HAS_YT = importlib.util.find_spec("googleapiclient") is not None
 except Exception:
     HAS_YT = False
 
 
-class ComposeRequest(BaseModel):
-    hero: Optional[str] = None
-
-
-class ComposeResponse(BaseModel):
-    hero: str
-    video_title: str
-    video_url: str
-    post_text: str
-
-
 if HAS_YT and os.getenv("YOUTUBE_API_KEY") and os.getenv("YOUTUBE_CHANNEL_ID"):
-    @app.post("/post/compose", response_model=ComposeResponse)
-    def compose_post(body: ComposeRequest):
+    @app.post("/post/compose", response_model=ComposeResponse, dependencies=[Depends(mini_app_session)])
+    async def compose_post(body: ComposeRequest):
+        # 1) выбираем героя
+        hero = body.hero
+        reservation = None
         try:
-            # 1) выбираем героя
-            hero = body.hero
             if not hero:
-                used = set(get_used_heroes())
-                remaining = [h for h in HEROES if h not in used]
-                if not remaining:
-                    raise HTTPException(409, "All heroes used. Reset needed.")
-                hero = random.choice(remaining)
-            # 2) находим видео по герою
-            video = find_video_for_hero(hero)
-            if not video:
-                raise HTTPException(404, f"No video found for hero {hero}")
-            # 3) генерим текст
-            post_text = generate_hero_post(hero) + f"\n{video['url']}"
-            return {
-                "hero": hero,
-                "video_title": video["title"],
-                "video_url": video["url"],
-                "post_text": post_text,
-            }
-        except HTTPException:
-            raise
+                reservation = await hero_rotation.reserve_async()
+                if reservation is None:
+                    raise HTTPException(409, "All heroes used or reserved. Reset needed.")
+                hero = reservation.hero
+            # 2) видео и текст — параллельно, под общим дедлайном
+            post = await compose_post_async(hero)
+            post["reservation_id"] = reservation.token if reservation else None
+            return post
         except Exception as e:
+            if reservation is not None:
+                # пост не собрался — не держим героя в брони
+                await hero_rotation.release_async(reservation.token)
+            if isinstance(e, HTTPException):
+                raise
+            if isinstance(e, NoVideoFound):
+                raise HTTPException(404, f"No video found for hero {hero}")
+            if isinstance(e, QuotaExhausted):
+                raise HTTPException(503, "YouTube quota budget exhausted for today")
+            if isinstance(e, ComposeTimeout):
+                raise HTTPException(504, "Compose deadline exceeded")
             print("[ERROR] /post/compose:", e)
             raise HTTPException(500, "Compose failed")
+
+    @app.post("/post/compose-batch", dependencies=[Depends(require_admin)])
+    async def compose_post_batch(body: ComposeBatchReq):
+        # черновики следующих N постов ротации; герои бронируются на POST_BATCH_RESERVATION_TTL
+        # (отказ от черновика — /heroes/release с его reservation_id)
+        try:
+            return await compose_batch_async(body.n)
+        except Exception as e:
+            print("[ERROR] /post/compose-batch:", e)
+            raise HTTPException(500, "Compose batch failed")
 else:
-    @app.post("/post/compose")
+    @app.post("/post/compose", dependencies=[Depends(mini_app_session)])
     def compose_post_unavailable(_: ComposeRequest):
         raise HTTPException(503, "YouTube integration is not configured yet")
 
+    @app.post("/post/compose-batch", dependencies=[Depends(require_admin)])
+    def compose_post_batch_unavailable(_: ComposeBatchReq):
+        raise HTTPException(503, "YouTube integration is not configured yet")
+
 
 class TGVerifyReq(BaseModel):
     init_data: str
 
 
-def _verify_tg_init_data(init_data: str) -> dict:
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        raise HTTPException(503, "TELEGRAM_BOT_TOKEN is not configured")
-    # Parse URL-encoded init_data string into dict of first values
-    q = parse_qs(init_data, keep_blank_values=True)
-    data = {k: v[0] for k, v in q.items()}
-    recv_hash = data.pop("hash", None)
-    if not recv_hash:
-        raise HTTPException(400, "Missing hash in init_data")
-    # Build data_check_string
-    pairs = [f"{k}={data[k]}" for k in sorted(data.keys())]
-    data_check_string = "\n".join(pairs)
-    secret_key = hashlib.sha256(token.encode()).digest()
-    calc_hash = hmac.new(secret_key, msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
-    if not hmac.compare_digest(calc_hash, recv_hash):
-        raise HTTPException(401, "Invalid init_data hash")
-    return data
-
-
 @app.post("/tg/verify")
 def tg_verify(body: TGVerifyReq):
+    # initData проверяется здесь один раз; дальше клиент ходит с session_token
     try:
-        data = _verify_tg_init_data(body.init_data)
-        # user comes as JSON string per Telegram spec
-        import json as _json
-        user_raw = data.get("user")
-        user = _json.loads(user_raw) if user_raw else None
-        return {"ok": True, "user": user, "auth_date": data.get("auth_date"), "query_id": data.get("query_id")}
+        data = verify_init_data(body.init_data)
+        user = init_data_user(data)
+        session = issue_session(user) if user else {}
+        return {"ok": True, "user": user, "auth_date": data.get("auth_date"), "query_id": data.get("query_id"), **session}
     except HTTPException:
         raise
     except Exception as e:
         print("[ERROR] /tg/verify:", e)
         raise HTTPException(500, "Verification failed")
 
+
+@app.get("/tg/me")
+def tg_me(session: dict = Depends(require_tg_session)):
+    return {"user_id": session["uid"], "username": session.get("name"), "expires_at": session["exp"]}
+
+
+@app.get("/debug/tg-auth")
+def debug_tg_auth():
+    return {"verified_cache": verified_cache.stats(), "max_age": TG_AUTH_MAX_AGE, "session_ttl": TG_SESSION_TTL}
+
 @app.get("/debug/ai-ping")
 def debug_ai_ping():
     if not os.getenv("GEMINI_API_KEY"):
         return {"ok": False, "reason": "no_api_key"}
     try:
-        import google.generativeai as genai  # type: ignore
-        model = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        resp = genai.GenerativeModel(model).generate_content("ok")
+        # модель из реестра: без повторного genai.configure и пересоздания клиента
+        resp = get_model().generate_content("ok")
         txt = (getattr(resp, "text", "") or "").strip().lower()
-        return {"ok": txt == "ok", "model": model}
+        return {"ok": txt == "ok", "model": GEMINI_MODEL}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
-@app.post("/youtube/video-for-hero")
+@app.post("/youtube/video-for-hero", dependencies=[Depends(mini_app_session)])
 def youtube_video_for_hero(body: HeroPick):
     if not HAS_YT or not os.getenv("YOUTUBE_API_KEY"):
         raise HTTPException(503, "YouTube API key not configured")
@@ -444,10 +908,37 @@ def youtube_video_for_hero(body: HeroPick):
         return video
     except HTTPException:
         raise
+    except QuotaExhausted:
+        raise HTTPException(503, "YouTube quota budget exhausted for today")
     except Exception as e:
         print("[ERROR] /youtube/video-for-hero:", e)
         raise HTTPException(500, "YouTube lookup failed")
 
+@app.post("/admin/youtube/sync", dependencies=[Depends(require_admin)])
+def admin_youtube_sync(full: bool = False):
+    if not HAS_YT or not os.getenv("YOUTUBE_API_KEY") or not os.getenv("YOUTUBE_CHANNEL_ID"):
+        raise HTTPException(503, "YouTube integration is not configured yet")
+    try:
+        return sync_channel_videos(full)
+    except QuotaExhausted:
+        raise HTTPException(503, "YouTube quota budget exhausted for today")
+    except Exception as e:
+        print("[ERROR] /admin/youtube/sync:", e)
+        raise HTTPException(500, "YouTube sync failed")
+
+@app.get("/debug/youtube-index")
+def debug_youtube_index():
+    if not HAS_YT:
+        raise HTTPException(503, "YouTube client is not available")
+    return channel_index.stats()
+
+@app.get("/debug/youtube-quota")
+def debug_youtube_quota():
+    if not HAS_YT:
+        raise HTTPException(503, "YouTube client is not available")
+    return youtube_quota_stats()
+
+
 @app.get("/debug/youtube-ping")
 def debug_youtube_ping():
     if not HAS_YT or not os.getenv("YOUTUBE_API_KEY"):
@@ -0,0 +1,86 @@
+# bench_async_ai.py
+# Сравнение пропускной способности AI-маршрутов: старый sync-путь (каждый запрос
+# занимает поток из пула Starlette, 40 штук) против async-пути с семафором.
+# Gemini подменён заглушкой с фиксированной задержкой, сеть не нужна.
+#
+#   cd backend && python bench_async_ai.py [requests] [delay_sec]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.environ["GEMINI_API_KEY"] = "bench"
+os.environ["AI_CACHE_PERSIST"] = "false"
+os.environ.setdefault("GEMINI_MAX_CONCURRENCY", "256")
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+import anyio.to_thread  # noqa: E402
+import google.generativeai as genai  # noqa: E402
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+DELAY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+
+
+class _Resp:
+    text = "— Saber\n— Chou"
+
+
+class StubModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(DELAY)
+        return _Resp()
+
+    async def generate_content_async(self, prompt, **kwargs):
+        await asyncio.sleep(DELAY)
+        return _Resp()
+
+
+genai.GenerativeModel = StubModel
+
+import ai_client  # noqa: E402
+
+
+async def run_sync_path():
+    # так FastAPI исполняет обычный `def`-маршрут: через anyio threadpool (лимит 40)
+    await asyncio.gather(*[
+        anyio.to_thread.run_sync(ai_client.generate_counter_pick, f"Hero{i}", None, None, True)
+        for i in range(N)
+    ])
+
+
+async def run_async_path():
+    await asyncio.gather(*[
+        ai_client.generate_counter_pick_async(f"Hero{i}", None, None, True)
+        for i in range(N)
+    ])
+
+
+async def health_latency_under(load):
+    # как долго ждёт лёгкий sync-маршрут (/health), пока идёт нагрузка
+    task = asyncio.ensure_future(load())
+    await asyncio.sleep(0.05)
+    t0 = time.perf_counter()
+    await anyio.to_thread.run_sync(lambda: {"status": "ok"})
+    waited = time.perf_counter() - t0
+    await task
+    return waited
+
+
+async def main():
+    print(f"requests={N} stub_delay={DELAY}s "
+          f"gemini_max_concurrency={ai_client.GEMINI_MAX_CONCURRENCY}")
+    for name, load in [("sync (threadpool)", run_sync_path), ("async", run_async_path)]:
+        t0 = time.perf_counter()
+        await load()
+        elapsed = time.perf_counter() - t0
+        health = await health_latency_under(load)
+        print(f"{name:18s} total={elapsed:6.2f}s  "
+              f"throughput={N / elapsed:7.1f} req/s  /health wait={health * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+# bench_async_db.py
+# get_quiz из async-кода: старый путь (asyncio.to_thread + sync Session)
+# против get_quiz_async (aiosqlite). Параллельно крутится «пульс» event loop —
+# его максимальная задержка показывает, блокируется ли loop.
+#
+#   cd backend && python bench_async_db.py [requests] [concurrency]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+import db  # noqa: E402
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+ROWS = 1000
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - t0 - 0.005)
+
+
+async def run(name: str, fetch):
+    sem = asyncio.Semaphore(CONCURRENCY)
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.ensure_future(heartbeat(stop, lags))
+
+    async def one():
+        async with sem:
+            q = await fetch(random.randint(1, ROWS))
+            assert q is not None
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(REQUESTS)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await beat
+    print(f"{name:10s} {REQUESTS / elapsed:8.0f} req/s  loop lag max={max(lags) * 1000:6.1f} ms")
+
+
+async def main():
+    print(f"requests={REQUESTS} concurrency={CONCURRENCY}")
+    await run("to_thread", lambda i: asyncio.to_thread(db.get_quiz, i))
+    await run("aiosqlite", db.get_quiz_async)
+    await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    db.init_db()
+    now = datetime.now(timezone.utc).isoformat()
+    for i in range(ROWS):
+        db.save_quiz(f"Вопрос {i}?", ["A", "B", "C", "D"], i % 4, None, now)
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+# bench_hero_reserve.py
+# Проверка атомарности /heroes/reserve: много параллельных «админов» бронируют
+# героев на временной базе. Ни один герой не должен достаться двоим, а после
+# истечения TTL брошенные брони возвращаются в пул.
+#
+#   cd backend && python bench_hero_reserve.py [pickers] [threads]
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+from heroes import HEROES  # noqa: E402
+from db import init_db, reserve_random_hero, mark_hero_used  # noqa: E402
+
+PICKERS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+
+def reserve(ttl: float):
+    r = reserve_random_hero(HEROES, ttl, datetime.now(timezone.utc).isoformat())
+    return (r.hero, r.token) if r else None
+
+
+def run(ttl: float):
+    with ThreadPoolExecutor(THREADS) as pool:
+        t0 = time.perf_counter()
+        results = list(pool.map(lambda _: reserve(ttl), range(PICKERS)))
+        elapsed = time.perf_counter() - t0
+    return [r for r in results if r], elapsed
+
+
+def main():
+    init_db()
+
+    got, elapsed = run(ttl=1.0)
+    dupes = [h for h, n in Counter(h for h, _ in got).items() if n > 1]
+    print(f"pickers={PICKERS} threads={THREADS} reserved={len(got)} "
+          f"roster={len(HEROES)} duplicates={len(dupes)} time={elapsed:.2f}s")
+    assert not dupes, f"hero reserved twice: {dupes}"
+    assert len(got) == min(PICKERS, len(HEROES))
+
+    # половину броней подтверждаем публикацией, остальные бросаем
+    kept = got[: len(got) // 2]
+    ts = datetime.now(timezone.utc).isoformat()
+    statuses = Counter(mark_hero_used(h, ts, token) for h, token in kept)
+    assert statuses == Counter({"ok": len(kept)}), statuses
+    # повторная отметка — не 500, а явный статус
+    assert mark_hero_used(kept[0][0], ts) == "used"
+
+    time.sleep(1.1)  # TTL истёк — брошенные брони снова доступны
+    again, _ = run(ttl=60)
+    used = {h for h, _ in kept}
+    assert not used & {h for h, _ in again}, "used hero was reserved again"
+    assert len(again) == len(HEROES) - len(used), (len(again), len(HEROES) - len(used))
+    print(f"after TTL: released={len(again)} used={len(used)} — OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# bench_model_registry.py
+# Микро-бенчмарк подготовки к вызову Gemini (без сети): сколько стоит собрать
+# GenerativeModel и получить gRPC-клиент на каждый запрос против реестра моделей.
+#
+#   cd backend && python bench_model_registry.py [iterations]
+import os
+import sys
+import tempfile
+import time
+
+os.environ["GEMINI_API_KEY"] = os.getenv("GEMINI_API_KEY") or "bench"
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+import google.generativeai as genai  # noqa: E402
+from google.generativeai import client as genai_client  # noqa: E402
+
+import ai_client  # noqa: E402
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+HINT = ai_client.SYSTEM_COUNTER_PICK
+
+
+def per_call_model():
+    # старый _call_gemini: новая модель, клиент берётся при первом generate_content
+    model = genai.GenerativeModel(ai_client.GEMINI_MODEL, system_instruction=HINT)
+    model._client = genai_client.get_default_generative_client()
+
+
+def per_call_configure():
+    # старый /debug/ai-ping: genai.configure сбрасывает кэш клиентов → новый канал
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    model = genai.GenerativeModel(ai_client.GEMINI_MODEL)
+    model._client = genai_client.get_default_generative_client()
+
+
+def registry():
+    model = ai_client.get_model(HINT)
+    if model._client is None:
+        model._client = genai_client.get_default_generative_client()
+
+
+def measure(fn, n):
+    fn()  # прогрев
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+if __name__ == "__main__":
+    print(f"iterations={N}")
+    rows = [
+        ("new model per call", measure(per_call_model, N)),
+        ("configure + model per call", measure(per_call_configure, max(N // 20, 10))),
+    ]
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    ai_client._models.clear()
+    ai_client.warm_up_models()
+    rows.append(("registry (warmed up)", measure(registry, N)))
+    for name, us in rows:
+        print(f"{name:28s} {us:10.1f} µs/call")
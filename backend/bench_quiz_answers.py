@@ -0,0 +1,72 @@
+# bench_quiz_answers.py
+# Всплеск ответов после поста в канале: по транзакции на ответ против
+# буфера AnswerRecorder (пачки по ANSWER_FLUSH_SIZE). Считаем ответы/с,
+# которые успевает записать SQLite, и сверяем рейтинг с сырыми событиями.
+#
+#   cd backend && python bench_quiz_answers.py [answers] [users]
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+os.environ.setdefault("ANSWER_FLUSH_INTERVAL", "0.05")
+
+import db  # noqa: E402
+from quiz_answers import AnswerRecorder, ANSWER_FLUSH_SIZE  # noqa: E402
+
+ANSWERS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+USERS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+
+def events(offset: int):
+    rnd = random.Random(offset)
+    return [(rnd.randrange(USERS) + offset, f"user{i % USERS}", i, rnd.random() < 0.6) for i in range(ANSWERS)]
+
+
+async def per_answer(evs):
+    t0 = time.perf_counter()
+    for user_id, name, quiz_id, correct in evs:
+        await db.record_quiz_answers_async([{
+            "user_id": user_id, "username": name, "quiz_id": quiz_id,
+            "correct": correct, "answered_at": "2026-01-01T00:00:00+00:00",
+        }])
+    return time.perf_counter() - t0
+
+
+async def buffered(evs):
+    rec = AnswerRecorder()
+    rec.start()
+    t0 = time.perf_counter()
+    for i, (user_id, name, quiz_id, correct) in enumerate(evs):
+        rec.record(user_id, name, quiz_id, correct)
+        if i % 100 == 0:
+            await asyncio.sleep(0)  # даём event loop сбросить пачку, как между HTTP-запросами
+    await rec.stop()
+    return time.perf_counter() - t0, rec.stats()
+
+
+async def main():
+    db.init_db()
+    print(f"answers={ANSWERS} users={USERS} flush_size={ANSWER_FLUSH_SIZE}")
+    t = await per_answer(events(0))
+    print(f"per-answer tx : {ANSWERS / t:8.0f} answers/s")
+    t, stats = await buffered(events(10 * USERS))
+    print(f"write-behind  : {ANSWERS / t:8.0f} answers/s  flushes={stats['flushes']}")
+
+    with db.engine.connect() as conn:
+        raw = conn.exec_driver_sql("SELECT COUNT(*), SUM(correct) FROM quizanswerevent").one()
+        agg = conn.exec_driver_sql("SELECT SUM(answered), SUM(correct) FROM quizscore").one()
+    assert tuple(raw) == tuple(agg), (raw, agg)
+    await db.list_leaderboard_async(10)
+    t0 = time.perf_counter()
+    top = await db.list_leaderboard_async(10)
+    print(f"leaderboard top10: {(time.perf_counter() - t0) * 1000:.2f} ms  leader={top[0].correct} correct"
+          f"  (aggregate matches events: {tuple(raw)})")
+    await db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+# bench_quiz_history.py
+# История квизов на синтетической таблице QuizQuestion (по умолчанию 1M строк):
+# keyset-курсор против OFFSET на разной глубине, с фильтрами и без,
+# плюс EXPLAIN QUERY PLAN — какие индексы реально используются.
+#
+#   cd backend && python bench_quiz_history.py [rows]
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+
+import db  # noqa: E402
+from db import list_quiz_history, _history_stmt  # noqa: E402
+from sqlmodel import Session  # noqa: E402
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PAGE = 20
+TOPICS = [None, "items", "heroes", "maps", "emblems", "spells"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def fill():
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    raw = db.engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        batch = []
+        for i in range(ROWS):
+            ts = (start + timedelta(seconds=i * 30)).isoformat()
+            batch.append((f"Вопрос {i}?", '["A","B","C","D"]', "A", "B", "C", "D", i % 4, ts,
+                          random.choice(TOPICS), random.choice(DIFFICULTIES), ts))
+            if len(batch) == 50_000:
+                cur.executemany(
+                    "INSERT INTO quizquestion (question, options_json, option_0, option_1, option_2, option_3,"
+                    " correct_index, created_at, topic, difficulty, served_at) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                    batch)
+                batch.clear()
+        if batch:
+            cur.executemany(
+                "INSERT INTO quizquestion (question, options_json, option_0, option_1, option_2, option_3,"
+                " correct_index, created_at, topic, difficulty, served_at) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+                batch)
+        raw.commit()
+        cur.execute("ANALYZE")
+    finally:
+        raw.close()
+
+
+def timed(fn, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def offset_page(depth: int, **filters):
+    with Session(db.engine) as s:
+        stmt = _history_stmt(PAGE, None, None, None, filters.get("difficulty"), filters.get("topic"))
+        return list(s.exec(stmt.offset(depth * PAGE)))
+
+
+def cursor_at(depth: int, **filters):
+    # ключ последней строки страницы depth-1 — как если бы клиент дошёл сюда курсором
+    if depth == 0:
+        return None
+    with Session(db.engine) as s:
+        stmt = _history_stmt(1, None, None, None, filters.get("difficulty"), filters.get("topic"))
+        q = s.exec(stmt.offset(depth * PAGE - 1)).first()
+        return (q.created_at, q.id) if q else None
+
+
+def plan(**kwargs):
+    stmt = _history_stmt(PAGE, ("2024-06-01", 1), None, None, kwargs.get("difficulty"), kwargs.get("topic"))
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    with db.engine.connect() as conn:
+        return " | ".join(r[-1] for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql))
+
+
+def main():
+    db.init_db()
+    t0 = time.perf_counter()
+    fill()
+    print(f"rows={ROWS} page={PAGE} fill={time.perf_counter() - t0:.1f}s")
+
+    cases = [
+        ("no filter", {}),
+        ("difficulty", {"difficulty": "hard"}),
+        ("topic", {"topic": "items"}),
+        ("topic+difficulty", {"topic": "items", "difficulty": "hard"}),
+    ]
+    for name, f in cases:
+        print(f"\n[{name}] plan: {plan(**f)}")
+        for depth in (0, 100, 2_000, 10_000, 40_000):
+            before = cursor_at(depth, **f)
+            if before is None and depth:
+                continue
+            keyset = timed(lambda: list_quiz_history(PAGE, before, difficulty=f.get("difficulty"),
+                                                     topic=f.get("topic")))
+            offset = timed(lambda: offset_page(depth, **f), repeat=3)
+            print(f"  page {depth:>6}: keyset {keyset:7.2f} ms   offset {offset:8.2f} ms")
+
+    r = timed(lambda: list_quiz_history(PAGE, created_from="2024-03-01", created_to="2024-03-02",
+                                        difficulty="easy"))
+    print(f"\n[created_at range + difficulty] first page {r:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench_sqlite.py
+# Смешанная нагрузка на save_quiz / get_quiz: профиль SQLite "default"
+# (rollback journal, как было) против "wal". Каждый профиль — на своей
+# временной базе, потоки-писатели и потоки-читатели работают одновременно.
+#
+#   cd backend && python bench_sqlite.py [seconds] [writers] [readers]
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "unused.sqlite3")
+
+import db  # noqa: E402
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+WRITERS = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+READERS = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+SEED_ROWS = 2000
+
+
+def _save(i: int):
+    return db.save_quiz(
+        question=f"Вопрос {i}?",
+        options=["A", "B", "C", "D"],
+        correct_index=i % 4,
+        explanation="bench",
+        created_at=datetime.now(timezone.utc).isoformat(),
+        difficulty="easy",
+    )
+
+
+def run_profile(profile: str):
+    db.engine = db.make_engine(Path(tempfile.mkdtemp()) / "bench.sqlite3", profile)
+    db.init_db()
+    for i in range(SEED_ROWS):
+        _save(i)
+
+    stop = time.perf_counter() + SECONDS
+    writes, reads, errors = [0], [0], [0]
+    read_lat = []
+    lock = threading.Lock()
+
+    def writer():
+        i = 0
+        while time.perf_counter() < stop:
+            try:
+                _save(i)
+                with lock:
+                    writes[0] += 1
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            i += 1
+
+    def reader():
+        local = []
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            try:
+                db.get_quiz(random.randint(1, SEED_ROWS))
+                local.append(time.perf_counter() - t0)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            reads[0] += len(local)
+            read_lat.extend(local)
+
+    threads = [threading.Thread(target=writer) for _ in range(WRITERS)]
+    threads += [threading.Thread(target=reader) for _ in range(READERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    read_lat.sort()
+    p99 = read_lat[int(len(read_lat) * 0.99)] * 1000 if read_lat else float("nan")
+    print(f"{profile:8s} writes/s={writes[0] / SECONDS:8.0f}  reads/s={reads[0] / SECONDS:8.0f}  "
+          f"read p99={p99:7.2f} ms  errors={errors[0]}")
+    db.engine.dispose()
+
+
+if __name__ == "__main__":
+    print(f"seconds={SECONDS} writers={WRITERS} readers={READERS} seed_rows={SEED_ROWS}")
+    for profile in ("default", "wal"):
+        run_profile(profile)
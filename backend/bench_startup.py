@@ -0,0 +1,83 @@
+# bench_startup.py
+# Холодный старт бэкенда в свежих процессах: время `import app`, какие
+# тяжёлые SDK оказались загружены сразу после импорта, и время от запуска
+# uvicorn до первого 200 на /health (то, что видит автоскейлер).
+#
+#   cd backend && python bench_startup.py [runs]
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+HEAVY = ["google.generativeai", "grpc", "googleapiclient.discovery", "IPython"]
+
+# без сети и фоновых задач: меряем сам старт, а не Gemini/YouTube
+ENV = {
+    **os.environ,
+    "DB_PATH": os.path.join(tempfile.mkdtemp(), "bench.sqlite3"),
+    "QUIZ_POOL_SIZE": "0",
+    "COUNTER_PICK_REFRESH_HOURS": "0",
+    "DAILY_PREGEN_DAYS": "-1",
+    "YOUTUBE_SYNC_INTERVAL": "0",
+}
+
+IMPORT_PROBE = f"""
+import sys, time, json
+t0 = time.perf_counter()
+import app
+dt = time.perf_counter() - t0
+print(json.dumps({{"seconds": dt, "loaded": [m for m in {HEAVY!r} if m in sys.modules]}}))
+"""
+
+
+def import_once():
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], env=ENV, capture_output=True, text=True, check=True)
+    import json
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def health_once(warmup: str) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        env={**ENV, "AI_WARMUP": warmup}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as r:
+                    if r.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited before serving /health")
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    imports = [import_once() for _ in range(RUNS)]
+    print(f"import app      : median {statistics.median(r['seconds'] for r in imports) * 1000:7.0f} ms"
+          f"  heavy loaded: {imports[0]['loaded'] or 'none'}")
+    for warmup in ("false", "background", "true"):
+        times = [health_once(warmup) for _ in range(RUNS)]
+        print(f"first /health   : median {statistics.median(times) * 1000:7.0f} ms  (AI_WARMUP={warmup})")
+
+
+if __name__ == "__main__":
+    main()
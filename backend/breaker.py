@@ -0,0 +1,95 @@
+import time
+import threading
+from typing import Dict, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Opens after N consecutive failed or slow calls; after reset_timeout lets one probe through."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, slow_call_seconds: float = 10.0,
+                 reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self.rejected = 0
+        self.opened_count = 0
+        self.last_error: Optional[str] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CLOSED:
+                return True
+            # пробный вызов мог потеряться (клиент отвалился) — не держим half_open вечно
+            if self._state == HALF_OPEN and (
+                    not self._probe_in_flight or now - self._probe_started >= self.reset_timeout):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def ready(self) -> bool:
+        # как allow(), но пробный слот half_open не занимает: дешёвая проверка до
+        # очереди за семафором, сам вызов потом всё равно спрашивает allow()
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            if self._state == HALF_OPEN and self._probe_in_flight and now - self._probe_started < self.reset_timeout:
+                self.rejected += 1
+                return False
+            return True
+
+    def record_success(self, duration: float, slow_call_seconds: Optional[float] = None):
+        if duration >= (slow_call_seconds or self.slow_call_seconds):
+            self.record_failure(f"slow call {duration:.1f}s")
+            return
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: str = ""):
+        with self._lock:
+            self._failures += 1
+            self.last_error = error or self.last_error
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened_count += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(0.0, round(self.reset_timeout - (time.monotonic() - self._opened_at), 1))
+            return {
+                "name": self.name,
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "slow_call_seconds": self.slow_call_seconds,
+                "reset_timeout": self.reset_timeout,
+                "retry_in": retry_in,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
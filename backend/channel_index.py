@@ -0,0 +1,100 @@
+import os
+import asyncio
+import threading
+from typing import Callable, Dict, List, Optional
+
+from db import list_youtube_videos, save_youtube_videos
+from hero_index import hero_names
+
+# Локальный индекс видео канала: все загрузки лежат в SQLite (YouTubeVideo),
+# в памяти — герой -> видео, от новых к старым. Поиск видео для героя —
+# обращение к словарю, без search.list (100 единиц квоты за вызов).
+YOUTUBE_SYNC_INTERVAL = int(os.getenv("YOUTUBE_SYNC_INTERVAL", "3600"))  # сек; 0 — без фоновой синхронизации
+
+
+class ChannelVideoIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = set()
+        self._by_hero: Dict[str, List[Dict]] = {}
+        self._videos = 0
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.last_sync: Optional[Dict] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._videos > 0
+
+    def load(self):
+        self._rebuild(list_youtube_videos())
+
+    def _rebuild(self, rows):
+        by_hero: Dict[str, List[Dict]] = {}
+        for r in rows:  # уже отсортированы от новых к старым
+            video = {
+                "title": r.title,
+                "url": f"https://www.youtube.com/watch?v={r.video_id}",
+                "publishedAt": r.published_at,
+            }
+            for hero in hero_names.match(r.title):
+                by_hero.setdefault(hero, []).append(video)
+        with self._lock:
+            self._ids = {r.video_id for r in rows}
+            self._by_hero = by_hero
+            self._videos = len(rows)
+
+    def known(self, video_id: str) -> bool:
+        return video_id in self._ids
+
+    def add(self, videos: List[Dict], synced_at: float) -> int:
+        saved = save_youtube_videos(videos, synced_at)
+        if saved:
+            self.load()
+        return saved
+
+    def lookup(self, hero: str) -> Optional[Dict]:
+        # самое свежее видео с героем в названии; имя приводим к ростеру, как при разборе названий
+        hero = hero_names.canonical(hero) or hero
+        with self._lock:
+            videos = self._by_hero.get(hero)
+        if not videos:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(videos[0])
+
+    # ===== Фоновая синхронизация =====
+
+    async def _run(self, sync: Callable[[bool], Dict]):
+        while True:
+            try:
+                self.last_sync = await asyncio.to_thread(sync, False)
+            except Exception as e:
+                print("[ERROR] youtube channel sync:", e)
+            await asyncio.sleep(YOUTUBE_SYNC_INTERVAL)
+
+    def start(self, sync: Callable[[bool], Dict]):
+        if YOUTUBE_SYNC_INTERVAL > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run(sync))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "videos": self._videos,
+                "heroes_covered": len(self._by_hero),
+                "hits": self.hits,
+                "misses": self.misses,
+                "sync_interval": YOUTUBE_SYNC_INTERVAL,
+                "last_sync": self.last_sync,
+            }
+
+
+channel_index = ChannelVideoIndex()
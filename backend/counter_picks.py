@@ -0,0 +1,175 @@
+import os
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from heroes import HEROES
+from hero_index import hero_names
+from db import list_counter_picks, list_counter_picks_async, save_counter_pick_async
+from ai_client import generate_counter_pick_async, stream_counter_pick, is_fallback_counter_pick
+
+# Предрасчитанные контр-пики на весь ростер HEROES. Таблица CounterPickAnswer
+# целиком держится в памяти (dict), живой Gemini — только для новых сочетаний.
+COUNTER_PICK_LANES = [x.strip().lower() for x in os.getenv("COUNTER_PICK_LANES", "").split(",") if x.strip()]
+COUNTER_PICK_ROLES = [x.strip().lower() for x in os.getenv("COUNTER_PICK_ROLES", "").split(",") if x.strip()]
+COUNTER_PICK_MAX_AGE_DAYS = float(os.getenv("COUNTER_PICK_MAX_AGE_DAYS", "7"))
+COUNTER_PICK_REFRESH_HOURS = float(os.getenv("COUNTER_PICK_REFRESH_HOURS", "24"))  # 0 — без расписания
+COUNTER_PICK_CONCURRENCY = int(os.getenv("COUNTER_PICK_CONCURRENCY", "4"))
+
+Key = Tuple[str, str, str]
+
+_HERO_SET = set(HEROES)
+
+
+def make_key(enemy: str, lane: Optional[str] = None, role: Optional[str] = None) -> Key:
+    enemy = enemy.strip()
+    return (
+        hero_names.canonical(enemy) or enemy,
+        (lane or "").strip().lower(),
+        (role or "").strip().lower(),
+    )
+
+
+class CounterPickTable:
+    def __init__(self):
+        self._answers: Dict[Key, Tuple[str, str]] = {}  # key -> (answer, created_at)
+        self._task: Optional[asyncio.Task] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.stream_aborted = 0
+
+    def load(self):
+        self._fill(list_counter_picks())
+
+    async def load_async(self):
+        self._fill(await list_counter_picks_async())
+
+    def _fill(self, rows: List):
+        self._answers = {(r.enemy, r.lane, r.role): (r.answer, r.created_at) for r in rows}
+
+    def get(self, enemy: str, lane: Optional[str] = None, role: Optional[str] = None) -> Optional[str]:
+        item = self._answers.get(make_key(enemy, lane, role))
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item[0]
+
+    async def remember(self, key: Key, answer: str, asked: Optional[str] = None):
+        # в таблицу попадают только герои из ростера и только настоящие ответы Gemini.
+        # Запасной текст собран из имени, как его ввёл пользователь ("fanny", "YSS"),
+        # а не из канонического key[0] — сверяем с ним
+        if key[0] not in _HERO_SET or is_fallback_counter_pick(asked or key[0], answer):
+            return
+        created_at = datetime.now(timezone.utc).isoformat()
+        self._answers[key] = (answer, created_at)
+        await save_counter_pick_async(*key, answer, created_at)
+
+    # ===== Ответ для маршрутов =====
+
+    async def answer(self, enemy: str, lane: Optional[str] = None, role: Optional[str] = None, fresh: bool = False) -> str:
+        if not fresh:
+            text = self.get(enemy, lane, role)
+            if text is not None:
+                return text
+        text = await generate_counter_pick_async(enemy, lane, role, fresh=fresh)
+        await self.remember(make_key(enemy, lane, role), text, asked=enemy)
+        return text
+
+    async def answer_stream(self, enemy: str, lane: Optional[str] = None, role: Optional[str] = None, fresh: bool = False) -> AsyncIterator[str]:
+        if not fresh:
+            text = self.get(enemy, lane, role)
+            if text is not None:
+                yield text
+                return
+        parts: List[str] = []
+        completed = False
+        try:
+            async for piece in stream_counter_pick(enemy, lane, role, fresh=fresh):
+                parts.append(piece)
+                yield piece
+            completed = True
+        finally:
+            # StreamInterrupted (ошибка/дедлайн Gemini посреди ответа) или отключение клиента:
+            # недописанный текст в таблицу не пишем
+            if not completed:
+                self.stream_aborted += 1
+        await self.remember(make_key(enemy, lane, role), "".join(parts).strip(), asked=enemy)
+
+    # ===== Пакетный предрасчёт =====
+
+    def combos(self) -> List[Key]:
+        lanes = ["", *COUNTER_PICK_LANES]
+        roles = ["", *COUNTER_PICK_ROLES]
+        return [(h, lane, role) for h, lane, role in itertools.product(HEROES, lanes, roles)]
+
+    def due(self, stale_before: str) -> List[Key]:
+        # нет ответа или он сгенерирован раньше stale_before (старый/до патча)
+        return [k for k in self.combos() if k not in self._answers or self._answers[k][1] < stale_before]
+
+    async def refresh(self, full: bool = False) -> Dict:
+        now = datetime.now(timezone.utc)
+        stale_before = now if full else now - timedelta(days=COUNTER_PICK_MAX_AGE_DAYS)
+        todo = self.due(stale_before.isoformat())
+        sem = asyncio.Semaphore(COUNTER_PICK_CONCURRENCY)
+        done = 0
+
+        async def one(key: Key):
+            nonlocal done
+            async with sem:
+                enemy, lane, role = key
+                text = await generate_counter_pick_async(enemy, lane or None, role or None, fresh=True)
+                if not is_fallback_counter_pick(enemy, text):
+                    await self.remember(key, text)
+                    done += 1
+
+        await asyncio.gather(*[one(k) for k in todo])
+        print(f"[counter-picks] refreshed {done}/{len(todo)} (full={full})")
+        return {"due": len(todo), "refreshed": done}
+
+    def start_refresh(self, full: bool = False) -> bool:
+        # фоновый прогон; если уже идёт — второй не запускаем
+        if self._refresh is not None and not self._refresh.done():
+            return False
+        self._refresh = asyncio.ensure_future(self._refresh_safe(full))
+        return True
+
+    async def _refresh_safe(self, full: bool):
+        try:
+            await self.refresh(full=full)
+        except Exception as e:
+            print("[ERROR] counter-pick refresh:", e)
+
+    async def _run(self):
+        while True:
+            self.start_refresh()
+            await asyncio.sleep(COUNTER_PICK_REFRESH_HOURS * 3600)
+
+    def start(self):
+        if COUNTER_PICK_REFRESH_HOURS > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = [t for t in (self._task, self._refresh) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._refresh = None
+
+    def stats(self) -> Dict:
+        combos = self.combos()
+        return {
+            "stored": len(self._answers),
+            "roster_combos": len(combos),
+            "covered": sum(1 for k in combos if k in self._answers),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stream_aborted": self.stream_aborted,
+            "refreshing": self._refresh is not None and not self._refresh.done(),
+        }
+
+
+counter_pick_table = CounterPickTable()
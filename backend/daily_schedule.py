@@ -0,0 +1,97 @@
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from db import list_daily_challenges_async, save_daily_challenge_async
+from ai_client import generate_daily_challenge_async, DAILY_FALLBACK
+
+# Челленджи генерируются заранее на DAILY_PREGEN_DAYS дней вперёд (по UTC).
+# Сегодняшний и будущие дни лежат в памяти процесса: /daily/generate
+# отвечает без SQLite и Gemini, а к полуночи следующий день уже готов.
+DAILY_PREGEN_DAYS = int(os.getenv("DAILY_PREGEN_DAYS", "3"))
+DAILY_CHECK_INTERVAL = int(os.getenv("DAILY_CHECK_INTERVAL", "900"))  # сек между проверками
+
+
+def utc_day(offset: int = 0) -> str:
+    return (datetime.now(timezone.utc).date() + timedelta(days=offset)).isoformat()
+
+
+class DailySchedule:
+    def __init__(self):
+        self._days: Dict[str, str] = {}  # YYYY-MM-DD -> текст
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def get(self, date_str: str) -> Optional[str]:
+        text = self._days.get(date_str)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def remember(self, date_str: str, text: str):
+        self._days[date_str] = text
+
+    async def load_async(self):
+        rows = await list_daily_challenges_async(utc_day(0), utc_day(DAILY_PREGEN_DAYS))
+        self._days.update({r.date: r.text for r in rows})
+
+    async def fill(self) -> int:
+        # дни [сегодня, сегодня + DAILY_PREGEN_DAYS]; прошедшие из памяти убираем
+        today = utc_day(0)
+        for day in [d for d in self._days if d < today]:
+            del self._days[day]
+        await self.load_async()
+        created = 0
+        for offset in range(DAILY_PREGEN_DAYS + 1):
+            day = utc_day(offset)
+            if day in self._days:
+                continue
+            text = await generate_daily_challenge_async(avoid=self._recent())
+            if text == DAILY_FALLBACK:
+                # Gemini недоступен — заглушку заранее не сохраняем, попробуем на следующей проверке
+                break
+            # другой процесс мог успеть раньше — тогда берём его запись
+            saved = await save_daily_challenge_async(day, text, datetime.now(timezone.utc).isoformat())
+            self._days[day] = saved.text
+            created += 1
+        self.generated += created
+        return created
+
+    def _recent(self) -> List[str]:
+        return [self._days[d] for d in sorted(self._days)][-7:]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.fill()
+            except Exception as e:
+                print("[ERROR] daily pregen:", e)
+            await asyncio.sleep(DAILY_CHECK_INTERVAL)
+
+    def start(self):
+        if DAILY_PREGEN_DAYS >= 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "days": sorted(self._days),
+            "pregen_days": DAILY_PREGEN_DAYS,
+            "check_interval": DAILY_CHECK_INTERVAL,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+        }
+
+
+daily_schedule = DailySchedule()
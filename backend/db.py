@@ -1,19 +1,94 @@
-from sqlmodel import SQLModel, Field, Session, create_engine, select
-from typing import Optional, List
+from sqlmodel import SQLModel, Field, Session, create_engine, select, delete, update, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Optional, List, Tuple, Dict
+from sqlalchemy import text, event, tuple_
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from pathlib import Path
 import json
+import os
+import time
+import secrets
+
+from metrics import observe
 
 # Путь к БД
 DB_DIR = Path(__file__).parent
 DB_DIR.mkdir(parents=True, exist_ok=True)
-DB_PATH = DB_DIR / "data.sqlite3"
+# DB_PATH из окружения — для бенчмарков/скриптов на временной базе
+DB_PATH = Path(os.getenv("DB_PATH") or DB_DIR / "data.sqlite3")
+
+# ===== Профиль SQLite =====
+# "wal": читатели не блокируются записью квизов/челленджей, fsync только на checkpoint.
+# "default": как было — rollback journal и настройки SQLite по умолчанию.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "16"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+SQLITE_PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+        "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "32768")),  # минус — размер в KiB
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def _install_pragmas(eng, profile: str):
+    pragmas = SQLITE_PROFILES[profile]
+
+    @event.listens_for(eng, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+
+
+def make_engine(path: Path, profile: str = SQLITE_PROFILE):
+    eng = create_engine(
+        f"sqlite:///{path}",
+        echo=False,
+        # Важно для uvicorn+Windows
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        poolclass=QueuePool,
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+        pool_timeout=SQLITE_POOL_TIMEOUT,
+    )
+    _install_pragmas(eng, profile)
+    return eng
+
+
+def make_async_engine(path: Path, profile: str = SQLITE_PROFILE):
+    # aiosqlite: свой пул соединений, те же PRAGMA, что и у синхронного движка
+    eng = create_async_engine(
+        f"sqlite+aiosqlite:///{path}",
+        echo=False,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+        pool_timeout=SQLITE_POOL_TIMEOUT,
+    )
+    _install_pragmas(eng.sync_engine, profile)
+    return eng
+
+
+engine = make_engine(DB_PATH)
+# для async def маршрутов — без прыжка в threadpool; синхронный API остаётся для скриптов
+async_engine = make_async_engine(DB_PATH)
+
 
-# Важно для uvicorn+Windows
-engine = create_engine(
-    f"sqlite:///{DB_PATH}",
-    echo=False,
-    connect_args={"check_same_thread": False},
-)
+def async_session() -> AsyncSession:
+    return AsyncSession(async_engine, expire_on_commit=False)
 
 # ===== Модели =====
 
@@ -23,13 +98,53 @@ class UsedHero(SQLModel, table=True):
     posted_at: Optional[str] = None  # ISO-строка
 
 
+class HeroReservation(SQLModel, table=True):
+    # герой выбран для поста, но ещё не отмечен использованным; после expires_at бронь не действует
+    hero: str = Field(primary_key=True)
+    token: str
+    expires_at: float                    # unix time
+    created_at: Optional[str] = None
+
+
 class QuizQuestion(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     question: str
-    options_json: str        # храним 4 варианта в JSON-строке
+    options_json: str        # 4 варианта в JSON-строке (старый формат, пишется для совместимости)
+    # те же 4 варианта отдельными колонками: отдаём вопрос без json.loads
+    option_0: Optional[str] = None
+    option_1: Optional[str] = None
+    option_2: Optional[str] = None
+    option_3: Optional[str] = None
     correct_index: int       # 0..3
     explanation: Optional[str] = None  # краткая причина/объяснение
     created_at: Optional[str] = None   # ISO-строка
+    topic: Optional[str] = None        # нормализованная тема (None — общая)
+    difficulty: Optional[str] = None   # easy / medium / hard
+    served_at: Optional[str] = None    # None — лежит в пуле и ещё не выдавался
+
+    @property
+    def options(self) -> List[str]:
+        if self.option_0 is None:
+            return json.loads(self.options_json)
+        return [self.option_0, self.option_1, self.option_2, self.option_3]
+
+
+class QuizAnswerEvent(SQLModel, table=True):
+    # сырые ответы пользователей; в рейтинг идёт только первый ответ на вопрос
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int
+    quiz_id: int
+    correct: bool
+    answered_at: str                     # ISO-строка
+
+
+class QuizScore(SQLModel, table=True):
+    # агрегат для рейтинга: обновляется при каждом сбросе буфера ответов
+    user_id: int = Field(primary_key=True)
+    username: Optional[str] = None
+    answered: int = 0
+    correct: int = 0
+    last_answer_at: Optional[str] = None
 
 
 class DailyChallenge(SQLModel, table=True):
@@ -37,15 +152,101 @@ class DailyChallenge(SQLModel, table=True):
     text: str
     created_at: Optional[str] = None
 
+
+class CounterPickAnswer(SQLModel, table=True):
+    # "" в lane/role — ответ без уточнения линии/роли
+    enemy: str = Field(primary_key=True)
+    lane: str = Field(default="", primary_key=True)
+    role: str = Field(default="", primary_key=True)
+    answer: str
+    created_at: str                      # ISO-строка, по ней решаем, что устарело
+
+
+class TierListEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # нормализованные фильтры role|lane|skill|note
+    data_json: str
+    updated_at: float                   # unix time
+
+
+class YouTubeVideoCache(SQLModel, table=True):
+    hero: str = Field(primary_key=True)  # нормализованное имя героя
+    video_json: Optional[str] = None     # None — видео не нашлось (негативный кэш)
+    fetched_at: float                    # unix time
+
+
+class YouTubeVideo(SQLModel, table=True):
+    # все загрузки канала (uploads playlist); героев по названию сопоставляет hero_index
+    video_id: str = Field(primary_key=True)
+    title: str
+    published_at: str = Field(index=True)  # ISO-строка от YouTube
+    synced_at: float                       # unix time
+
+
+class YouTubeQuotaUsage(SQLModel, table=True):
+    day: str = Field(primary_key=True)        # YYYY-MM-DD по тихоокеанскому времени (сброс квоты YouTube)
+    call_type: str = Field(primary_key=True)  # search.list/channel, search.list/global, ...
+    calls: int = 0
+    units: int = 0
+
+
+class AICacheEntry(SQLModel, table=True):
+    key: str = Field(primary_key=True)  # sha256(model, system_hint, prompt)
+    kind: str = Field(index=True)       # counter_pick / tier_list / ...
+    text: str
+    expires_at: float                   # unix time
+    created_at: Optional[str] = None
+
 # ===== Инициализация =====
 
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+    _migrate()
+
+
+# create_all не добавляет колонки в уже существующие таблицы — докидываем руками
+_MIGRATIONS = {
+    "quizquestion": [
+        ("topic", "VARCHAR", None),
+        ("difficulty", "VARCHAR", None),
+        # старые вопросы уже выданы — в пул они попасть не должны
+        ("served_at", "VARCHAR", "UPDATE quizquestion SET served_at = COALESCE(created_at, '') WHERE served_at IS NULL"),
+        *[(f"option_{i}", "VARCHAR",
+           f"UPDATE quizquestion SET option_{i} = json_extract(options_json, '$[{i}]') WHERE option_{i} IS NULL")
+          for i in range(4)],
+    ],
+}
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_quiz_pool ON quizquestion (difficulty, topic, served_at)",
+    # история квизов: ORDER BY created_at DESC, id DESC + фильтры — без сортировки и без скана
+    "CREATE INDEX IF NOT EXISTS ix_quiz_history ON quizquestion (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_quiz_history_difficulty ON quizquestion (difficulty, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_quiz_history_topic ON quizquestion (topic, created_at, id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_quiz_answer ON quizanswerevent (user_id, quiz_id)",
+    "CREATE INDEX IF NOT EXISTS ix_quiz_score_rank ON quizscore (correct DESC, answered, last_answer_at)",
+    # чистка просроченного кэша ИИ: DELETE ... WHERE expires_at <= now — по индексу, без скана
+    "CREATE INDEX IF NOT EXISTS ix_ai_cache_expires ON aicacheentry (expires_at)",
+]
+
+
+def _migrate():
+    with engine.begin() as conn:
+        for table, columns in _MIGRATIONS.items():
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+            for name, type_, backfill in columns:
+                if name in existing:
+                    continue
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {type_}")
+                if backfill:
+                    conn.exec_driver_sql(backfill)
+        for ddl in _INDEXES:
+            conn.exec_driver_sql(ddl)
 
 # ===== Герои =====
 
 
+@observe("sqlite")
 def get_used_heroes() -> List[str]:
     with Session(engine) as s:
         rows = s.exec(select(UsedHero.hero)).all()
@@ -56,28 +257,172 @@ def get_used_heroes() -> List[str]:
     return result
 
 
-def mark_hero_used(hero: str, ts: str):
+@observe("sqlite")
+async def get_used_heroes_async() -> List[str]:
+    async with async_session() as s:
+        return list((await s.exec(select(UsedHero.hero))).all())
+
+
+# один INSERT: не пишем, если героя держит чужая живая бронь; дубликат не падает на PK
+_MARK_USED_SQL = text("""
+    INSERT INTO usedhero (hero, posted_at)
+    SELECT :hero, :ts
+    WHERE NOT EXISTS (
+        SELECT 1 FROM heroreservation
+        WHERE hero = :hero AND expires_at > :now AND token IS NOT :token AND NOT :override
+    )
+    ON CONFLICT(hero) DO NOTHING
+""")
+
+
+@observe("sqlite")
+def mark_hero_used(hero: str, ts: str, reservation_token: Optional[str] = None, override: bool = False) -> str:
+    """Returns "ok", "used" (already posted) or "reserved" (held by another reservation)."""
+    # override — админ публикует без токена: чужая бронь не мешает и снимается вместе с отметкой
+    params = {"hero": hero, "ts": ts, "now": time.time(), "token": reservation_token, "override": override}
+    with engine.begin() as conn:
+        res = conn.execute(_MARK_USED_SQL, params)
+        if res.rowcount == 1:
+            conn.execute(delete(HeroReservation).where(HeroReservation.hero == hero))
+            return "ok"
+        used = conn.execute(select(UsedHero.hero).where(UsedHero.hero == hero)).first()
+        return "used" if used else "reserved"
+
+
+@observe("sqlite")
+async def mark_hero_used_async(hero: str, ts: str, reservation_token: Optional[str] = None,
+                                override: bool = False) -> str:
+    params = {"hero": hero, "ts": ts, "now": time.time(), "token": reservation_token, "override": override}
+    async with async_engine.begin() as conn:
+        res = await conn.execute(_MARK_USED_SQL, params)
+        if res.rowcount == 1:
+            await conn.execute(delete(HeroReservation).where(HeroReservation.hero == hero))
+            return "ok"
+        used = (await conn.execute(select(UsedHero.hero).where(UsedHero.hero == hero))).first()
+        return "used" if used else "reserved"
+
+
+# SQLite выполняет INSERT целиком под write-lock: два параллельных вызова
+# не могут выбрать одного героя. Просроченная бронь перезаписывается.
+_RESERVE_SQL = text("""
+    INSERT INTO heroreservation (hero, token, expires_at, created_at)
+    SELECT r.value, :token, :expires_at, :created_at
+    FROM json_each(:roster) AS r
+    WHERE r.value NOT IN (SELECT hero FROM usedhero)
+      AND r.value NOT IN (SELECT hero FROM heroreservation WHERE expires_at > :now)
+    ORDER BY random()
+    LIMIT 1
+    ON CONFLICT(hero) DO UPDATE SET
+        token = excluded.token,
+        expires_at = excluded.expires_at,
+        created_at = excluded.created_at
+    RETURNING hero
+""")
+
+
+def _reserve_params(roster: List[str], ttl_seconds: float, created_at: str) -> dict:
+    now = time.time()
+    return {
+        "roster": json.dumps(roster, ensure_ascii=False),
+        "token": secrets.token_urlsafe(16),
+        "expires_at": now + ttl_seconds,
+        "created_at": created_at,
+        "now": now,
+    }
+
+
+def _reservation(row, params: dict) -> Optional[HeroReservation]:
+    if row is None:
+        return None
+    return HeroReservation(hero=row[0], token=params["token"],
+                           expires_at=params["expires_at"], created_at=params["created_at"])
+
+
+@observe("sqlite")
+def reserve_random_hero(roster: List[str], ttl_seconds: float, created_at: str) -> Optional[HeroReservation]:
+    """Atomically pick a random hero that is neither used nor reserved and reserve it."""
+    params = _reserve_params(roster, ttl_seconds, created_at)
+    with engine.begin() as conn:
+        row = conn.execute(_RESERVE_SQL, params).first()
+    return _reservation(row, params)
+
+
+@observe("sqlite")
+async def reserve_random_hero_async(roster: List[str], ttl_seconds: float, created_at: str) -> Optional[HeroReservation]:
+    params = _reserve_params(roster, ttl_seconds, created_at)
+    async with async_engine.begin() as conn:
+        row = (await conn.execute(_RESERVE_SQL, params)).first()
+    return _reservation(row, params)
+
+
+# токен брони — секрет, выданный при бронировании: по нему одному бронь и снимается
+_RELEASE_SQL = text("DELETE FROM heroreservation WHERE token = :token RETURNING hero")
+
+
+@observe("sqlite")
+def release_hero_reservation(token: str) -> Optional[str]:
+    """Drop a reservation early (draft failed or discarded); returns the freed hero."""
+    with engine.begin() as conn:
+        row = conn.execute(_RELEASE_SQL, {"token": token}).first()
+    return row[0] if row else None
+
+
+@observe("sqlite")
+async def release_hero_reservation_async(token: str) -> Optional[str]:
+    async with async_engine.begin() as conn:
+        row = (await conn.execute(_RELEASE_SQL, {"token": token})).first()
+    return row[0] if row else None
+
+
+def _active_reservations_stmt():
+    return select(func.count()).select_from(HeroReservation).where(
+        HeroReservation.expires_at > time.time())
+
+
+@observe("sqlite")
+def count_active_reservations() -> int:
     with Session(engine) as s:
-        s.add(UsedHero(hero=hero, posted_at=ts))
-        s.commit()
+        return s.exec(_active_reservations_stmt()).one()
 
 
+@observe("sqlite")
 def reset_heroes():
     with Session(engine) as s:
-        s.exec("DELETE FROM usedhero")
+        s.exec(delete(UsedHero))
+        s.exec(delete(HeroReservation))
         s.commit()
 
+
+@observe("sqlite")
+async def reset_heroes_async():
+    async with async_session() as s:
+        await s.exec(delete(UsedHero))
+        await s.exec(delete(HeroReservation))
+        await s.commit()
+
 # ===== Квизы =====
 
 
-def save_quiz(question: str, options: List[str], correct_index: int, explanation: Optional[str], created_at: str) -> int:
-    q = QuizQuestion(
+def _new_quiz(question: str, options: List[str], correct_index: int, explanation: Optional[str], created_at: str,
+              topic: Optional[str], difficulty: Optional[str], served: bool) -> QuizQuestion:
+    # served=False — вопрос кладётся в пул и будет выдан позже
+    return QuizQuestion(
         question=question,
         options_json=json.dumps(options, ensure_ascii=False),
+        option_0=options[0], option_1=options[1], option_2=options[2], option_3=options[3],
         correct_index=correct_index,
         explanation=explanation,
         created_at=created_at,
+        topic=topic,
+        difficulty=difficulty,
+        served_at=created_at if served else None,
     )
+
+
+@observe("sqlite")
+def save_quiz(question: str, options: List[str], correct_index: int, explanation: Optional[str], created_at: str,
+              topic: Optional[str] = None, difficulty: Optional[str] = None, served: bool = True) -> int:
+    q = _new_quiz(question, options, correct_index, explanation, created_at, topic, difficulty, served)
     with Session(engine) as s:
         s.add(q)
         s.commit()
@@ -85,33 +430,544 @@ def save_quiz(question: str, options: List[str], correct_index: int, explanation
         return q.id
 
 
+@observe("sqlite")
+async def save_quiz_async(question: str, options: List[str], correct_index: int, explanation: Optional[str],
+                          created_at: str, topic: Optional[str] = None, difficulty: Optional[str] = None,
+                          served: bool = True) -> int:
+    q = _new_quiz(question, options, correct_index, explanation, created_at, topic, difficulty, served)
+    async with async_session() as s:
+        s.add(q)
+        await s.commit()
+        return q.id
+
+
+def _new_quizzes(items: List[dict], created_at: str, topic: Optional[str], difficulty: Optional[str],
+                 served: bool) -> List[QuizQuestion]:
+    return [
+        _new_quiz(it["question"], it["options"], int(it["correct_index"]), it.get("explanation"),
+                  created_at, topic, difficulty, served)
+        for it in items
+    ]
+
+
+@observe("sqlite")
+def save_quizzes(items: List[dict], created_at: str, topic: Optional[str] = None,
+                 difficulty: Optional[str] = None, served: bool = True) -> List[int]:
+    """Insert a batch of questions in one transaction; returns ids in input order."""
+    rows = _new_quizzes(items, created_at, topic, difficulty, served)
+    with Session(engine) as s:
+        s.add_all(rows)
+        s.flush()  # id известны после flush — без refresh на каждую строку
+        ids = [q.id for q in rows]
+        s.commit()
+        return ids
+
+
+@observe("sqlite")
+async def save_quizzes_async(items: List[dict], created_at: str, topic: Optional[str] = None,
+                             difficulty: Optional[str] = None, served: bool = True) -> List[int]:
+    rows = _new_quizzes(items, created_at, topic, difficulty, served)
+    async with async_session() as s:
+        s.add_all(rows)
+        await s.flush()
+        ids = [q.id for q in rows]
+        await s.commit()
+        return ids
+
+
+@observe("sqlite")
 def get_quiz(quiz_id: int) -> Optional[QuizQuestion]:
     with Session(engine) as s:
         q = s.get(QuizQuestion, quiz_id)
         return q
 
 
+@observe("sqlite")
+async def get_quiz_async(quiz_id: int) -> Optional[QuizQuestion]:
+    async with async_session() as s:
+        return await s.get(QuizQuestion, quiz_id)
+
+
+def _quizzes_by_id_stmt(quiz_ids: List[int]):
+    return select(QuizQuestion).where(QuizQuestion.id.in_(set(quiz_ids)))
+
+
+@observe("sqlite")
+def get_quizzes(quiz_ids: List[int]) -> Dict[int, QuizQuestion]:
+    """Fetch many questions with one IN query; missing ids are simply absent."""
+    if not quiz_ids:
+        return {}
+    with Session(engine) as s:
+        return {q.id: q for q in s.exec(_quizzes_by_id_stmt(quiz_ids))}
+
+
+@observe("sqlite")
+async def get_quizzes_async(quiz_ids: List[int]) -> Dict[int, QuizQuestion]:
+    if not quiz_ids:
+        return {}
+    async with async_session() as s:
+        return {q.id: q for q in await s.exec(_quizzes_by_id_stmt(quiz_ids))}
+
+
+def _pool_filter(stmt, topic: Optional[str], difficulty: str):
+    stmt = stmt.where(QuizQuestion.served_at == None)  # noqa: E711
+    stmt = stmt.where(QuizQuestion.difficulty == difficulty)
+    if topic is None:
+        return stmt.where(QuizQuestion.topic == None)  # noqa: E711
+    return stmt.where(QuizQuestion.topic == topic)
+
+
+def _pool_count_stmt(topic: Optional[str], difficulty: str):
+    return _pool_filter(select(func.count()).select_from(QuizQuestion), topic, difficulty)
+
+
+def _pool_head_stmt(topic: Optional[str], difficulty: str):
+    return _pool_filter(select(QuizQuestion), topic, difficulty).order_by(QuizQuestion.id).limit(1)
+
+
+def _mark_served_stmt(quiz_id: int, served_at: str):
+    # served_at IS NULL в WHERE: если параллельный запрос успел раньше — берём следующий
+    return (
+        update(QuizQuestion)
+        .where(QuizQuestion.id == quiz_id, QuizQuestion.served_at == None)  # noqa: E711
+        .values(served_at=served_at)
+    )
+
+
+@observe("sqlite")
+def count_unserved_quizzes(topic: Optional[str], difficulty: str) -> int:
+    with Session(engine) as s:
+        return s.exec(_pool_count_stmt(topic, difficulty)).one()
+
+
+@observe("sqlite")
+async def count_unserved_quizzes_async(topic: Optional[str], difficulty: str) -> int:
+    async with async_session() as s:
+        return (await s.exec(_pool_count_stmt(topic, difficulty))).one()
+
+
+@observe("sqlite")
+def pop_unserved_quiz(topic: Optional[str], difficulty: str, served_at: str) -> Tuple[Optional[QuizQuestion], int]:
+    """Take the oldest unserved question of a bucket; returns (quiz, remaining)."""
+    with Session(engine) as s:
+        while True:
+            q = s.exec(_pool_head_stmt(topic, difficulty)).first()
+            if q is None:
+                return None, 0
+            res = s.exec(_mark_served_stmt(q.id, served_at))
+            s.commit()
+            if res.rowcount == 1:
+                s.refresh(q)
+                return q, s.exec(_pool_count_stmt(topic, difficulty)).one()
+
+
+@observe("sqlite")
+async def pop_unserved_quiz_async(topic: Optional[str], difficulty: str,
+                                  served_at: str) -> Tuple[Optional[QuizQuestion], int]:
+    async with async_session() as s:
+        while True:
+            q = (await s.exec(_pool_head_stmt(topic, difficulty))).first()
+            if q is None:
+                return None, 0
+            res = await s.exec(_mark_served_stmt(q.id, served_at))
+            await s.commit()
+            if res.rowcount == 1:
+                await s.refresh(q)
+                return q, (await s.exec(_pool_count_stmt(topic, difficulty))).one()
+
+
+@observe("sqlite")
 def list_quizzes(limit: int = 10) -> List[QuizQuestion]:
     with Session(engine) as s:
         stmt = select(QuizQuestion).order_by(QuizQuestion.id.desc()).limit(limit)
         return list(s.exec(stmt))
 
+
+def _history_stmt(limit: int, before: Optional[Tuple[str, int]], created_from: Optional[str],
+                  created_to: Optional[str], difficulty: Optional[str], topic: Optional[str]):
+    stmt = select(QuizQuestion)
+    if before is not None:
+        # keyset: продолжаем строго после последней строки прошлой страницы, без OFFSET
+        stmt = stmt.where(tuple_(QuizQuestion.created_at, QuizQuestion.id) < tuple_(*before))
+    if created_from:
+        stmt = stmt.where(QuizQuestion.created_at >= created_from)
+    if created_to:
+        stmt = stmt.where(QuizQuestion.created_at < created_to)
+    if difficulty:
+        stmt = stmt.where(QuizQuestion.difficulty == difficulty)
+    if topic:
+        stmt = stmt.where(QuizQuestion.topic == topic)
+    return stmt.order_by(QuizQuestion.created_at.desc(), QuizQuestion.id.desc()).limit(limit)
+
+
+@observe("sqlite")
+def list_quiz_history(limit: int = 20, before: Optional[Tuple[str, int]] = None,
+                      created_from: Optional[str] = None, created_to: Optional[str] = None,
+                      difficulty: Optional[str] = None, topic: Optional[str] = None) -> List[QuizQuestion]:
+    """Newest first; pass (created_at, id) of the last row as `before` for the next page."""
+    with Session(engine) as s:
+        return list(s.exec(_history_stmt(limit, before, created_from, created_to, difficulty, topic)))
+
+
+@observe("sqlite")
+async def list_quiz_history_async(limit: int = 20, before: Optional[Tuple[str, int]] = None,
+                                  created_from: Optional[str] = None, created_to: Optional[str] = None,
+                                  difficulty: Optional[str] = None, topic: Optional[str] = None) -> List[QuizQuestion]:
+    async with async_session() as s:
+        return list(await s.exec(_history_stmt(limit, before, created_from, created_to, difficulty, topic)))
+
+# ===== Ответы и рейтинг =====
+
+_SCORE_SQL = text("""
+    INSERT INTO quizscore (user_id, username, answered, correct, last_answer_at)
+    VALUES (:user_id, :username, :answered, :correct, :last_answer_at)
+    ON CONFLICT(user_id) DO UPDATE SET
+        username = COALESCE(excluded.username, quizscore.username),
+        answered = quizscore.answered + excluded.answered,
+        correct = quizscore.correct + excluded.correct,
+        last_answer_at = MAX(COALESCE(quizscore.last_answer_at, ''), excluded.last_answer_at)
+""")
+
+
+def _answer_insert_stmt():
+    # одна многострочная вставка; RETURNING отдаёт только реально вставленные (первые) ответы
+    return (
+        sqlite_insert(QuizAnswerEvent)
+        .on_conflict_do_nothing(index_elements=["user_id", "quiz_id"])
+        .returning(QuizAnswerEvent.user_id, QuizAnswerEvent.correct)
+    )
+
+
+def _answer_rows(events: List[dict]) -> List[dict]:
+    return [{k: ev[k] for k in ("user_id", "quiz_id", "correct", "answered_at")} for ev in events]
+
+
+def _score_deltas(events: List[dict], inserted) -> List[dict]:
+    deltas: Dict[int, dict] = {}
+    for ev in events:
+        d = deltas.setdefault(ev["user_id"], {
+            "user_id": ev["user_id"], "username": None, "answered": 0, "correct": 0, "last_answer_at": "",
+        })
+        d["username"] = ev.get("username") or d["username"]
+        d["last_answer_at"] = max(d["last_answer_at"], ev["answered_at"])
+    for user_id, correct in inserted:
+        deltas[user_id]["answered"] += 1
+        deltas[user_id]["correct"] += int(correct)
+    return list(deltas.values())
+
+
+@observe("sqlite")
+def record_quiz_answers(events: List[dict]) -> int:
+    """Insert answer events and bump QuizScore in one transaction; returns newly counted answers."""
+    if not events:
+        return 0
+    with engine.begin() as conn:
+        inserted = conn.execute(_answer_insert_stmt(), _answer_rows(events)).all()
+        conn.execute(_SCORE_SQL, _score_deltas(events, inserted))
+    return len(inserted)
+
+
+@observe("sqlite")
+async def record_quiz_answers_async(events: List[dict]) -> int:
+    if not events:
+        return 0
+    async with async_engine.begin() as conn:
+        inserted = (await conn.execute(_answer_insert_stmt(), _answer_rows(events))).all()
+        await conn.execute(_SCORE_SQL, _score_deltas(events, inserted))
+    return len(inserted)
+
+
+def _leaderboard_stmt(limit: int):
+    return select(QuizScore).order_by(
+        QuizScore.correct.desc(), QuizScore.answered, QuizScore.last_answer_at).limit(limit)
+
+
+@observe("sqlite")
+def list_leaderboard(limit: int = 10) -> List[QuizScore]:
+    with Session(engine) as s:
+        return list(s.exec(_leaderboard_stmt(limit)))
+
+
+@observe("sqlite")
+async def list_leaderboard_async(limit: int = 10) -> List[QuizScore]:
+    async with async_session() as s:
+        return list(await s.exec(_leaderboard_stmt(limit)))
+
 # ===== Daily Challenge =====
 
 
-def save_daily_challenge(date_str: str, text: str, created_at: str):
+@observe("sqlite")
+def save_daily_challenge(date_str: str, text: str, created_at: str) -> DailyChallenge:
+    # если другой процесс успел записать день раньше — возвращаем его запись
     dc = DailyChallenge(date=date_str, text=text, created_at=created_at)
     with Session(engine) as s:
         s.add(dc)
-        s.commit()
+        try:
+            s.commit()
+        except IntegrityError:
+            s.rollback()
+            return s.get(DailyChallenge, date_str)
+        s.refresh(dc)
+        return dc
+
+
+@observe("sqlite")
+async def save_daily_challenge_async(date_str: str, text: str, created_at: str) -> DailyChallenge:
+    dc = DailyChallenge(date=date_str, text=text, created_at=created_at)
+    async with async_session() as s:
+        s.add(dc)
+        try:
+            await s.commit()
+        except IntegrityError:
+            await s.rollback()
+            return await s.get(DailyChallenge, date_str)
+        return dc
 
 
+@observe("sqlite")
 def get_daily_challenge(date_str: str) -> Optional[DailyChallenge]:
     with Session(engine) as s:
         dc = s.get(DailyChallenge, date_str)
         return dc
 
 
+@observe("sqlite")
+async def get_daily_challenge_async(date_str: str) -> Optional[DailyChallenge]:
+    async with async_session() as s:
+        return await s.get(DailyChallenge, date_str)
+
+
+@observe("sqlite")
+async def list_daily_challenges_async(date_from: str, date_to: str) -> List[DailyChallenge]:
+    # даты в формате YYYY-MM-DD сравниваются как строки; обе границы включительно
+    async with async_session() as s:
+        stmt = select(DailyChallenge).where(
+            DailyChallenge.date >= date_from, DailyChallenge.date <= date_to).order_by(DailyChallenge.date)
+        return list(await s.exec(stmt))
+
+
+# ===== Кэш ответов ИИ =====
+
+
+@observe("sqlite")
+def get_ai_cache(key: str, now: float) -> Optional[AICacheEntry]:
+    with Session(engine) as s:
+        entry = s.get(AICacheEntry, key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            # просроченную строку удаляем сразу; остальные — purge_ai_cache
+            s.delete(entry)
+            s.commit()
+            return None
+        return entry
+
+
+@observe("sqlite")
+async def get_ai_cache_async(key: str, now: float) -> Optional[AICacheEntry]:
+    async with async_session() as s:
+        entry = await s.get(AICacheEntry, key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            await s.delete(entry)
+            await s.commit()
+            return None
+        return entry
+
+
+@observe("sqlite")
+def save_ai_cache(key: str, kind: str, text: str, expires_at: float, created_at: str):
+    with Session(engine) as s:
+        s.merge(AICacheEntry(key=key, kind=kind, text=text,
+                expires_at=expires_at, created_at=created_at))
+        s.commit()
+
+
+@observe("sqlite")
+async def save_ai_cache_async(key: str, kind: str, text: str, expires_at: float, created_at: str):
+    async with async_session() as s:
+        await s.merge(AICacheEntry(key=key, kind=kind, text=text,
+                      expires_at=expires_at, created_at=created_at))
+        await s.commit()
+
+
+def _clear_ai_cache_stmt(kind: Optional[str]):
+    stmt = delete(AICacheEntry)
+    if kind:
+        stmt = stmt.where(AICacheEntry.kind == kind)
+    return stmt
+
+
+@observe("sqlite")
+def clear_ai_cache(kind: Optional[str] = None) -> int:
+    with Session(engine) as s:
+        res = s.exec(_clear_ai_cache_stmt(kind))
+        s.commit()
+        return res.rowcount
+
+
+def _purge_ai_cache_stmt(now: float):
+    return delete(AICacheEntry).where(AICacheEntry.expires_at <= now)
+
+
+@observe("sqlite")
+def purge_ai_cache(now: float) -> int:
+    # ключи кэша — из свободного текста пользователей: без чистки таблица растёт бесконечно
+    with Session(engine) as s:
+        res = s.exec(_purge_ai_cache_stmt(now))
+        s.commit()
+        return res.rowcount
+
+
+@observe("sqlite")
+async def purge_ai_cache_async(now: float) -> int:
+    async with async_session() as s:
+        res = await s.exec(_purge_ai_cache_stmt(now))
+        await s.commit()
+        return res.rowcount
+
+
+# ===== Контр-пики (предрасчёт) =====
+
+
+@observe("sqlite")
+def list_counter_picks() -> List[CounterPickAnswer]:
+    with Session(engine) as s:
+        return list(s.exec(select(CounterPickAnswer)))
+
+
+@observe("sqlite")
+async def list_counter_picks_async() -> List[CounterPickAnswer]:
+    async with async_session() as s:
+        return list(await s.exec(select(CounterPickAnswer)))
+
+
+@observe("sqlite")
+def save_counter_pick(enemy: str, lane: str, role: str, answer: str, created_at: str):
+    with Session(engine) as s:
+        s.merge(CounterPickAnswer(enemy=enemy, lane=lane, role=role,
+                answer=answer, created_at=created_at))
+        s.commit()
+
+
+@observe("sqlite")
+async def save_counter_pick_async(enemy: str, lane: str, role: str, answer: str, created_at: str):
+    async with async_session() as s:
+        await s.merge(CounterPickAnswer(enemy=enemy, lane=lane, role=role,
+                      answer=answer, created_at=created_at))
+        await s.commit()
+
+
+# ===== Tier list (stale-while-revalidate) =====
+
+
+@observe("sqlite")
+def list_tier_lists() -> List[TierListEntry]:
+    with Session(engine) as s:
+        return list(s.exec(select(TierListEntry)))
+
+
+@observe("sqlite")
+async def list_tier_lists_async() -> List[TierListEntry]:
+    async with async_session() as s:
+        return list(await s.exec(select(TierListEntry)))
+
+
+@observe("sqlite")
+def save_tier_list(key: str, data_json: str, updated_at: float):
+    with Session(engine) as s:
+        s.merge(TierListEntry(key=key, data_json=data_json, updated_at=updated_at))
+        s.commit()
+
+
+@observe("sqlite")
+async def save_tier_list_async(key: str, data_json: str, updated_at: float):
+    async with async_session() as s:
+        await s.merge(TierListEntry(key=key, data_json=data_json, updated_at=updated_at))
+        await s.commit()
+
+
+@observe("sqlite")
+def clear_tier_lists() -> int:
+    with Session(engine) as s:
+        res = s.exec(delete(TierListEntry))
+        s.commit()
+        return res.rowcount
+
+
+@observe("sqlite")
+async def clear_tier_lists_async() -> int:
+    async with async_session() as s:
+        res = await s.exec(delete(TierListEntry))
+        await s.commit()
+        return res.rowcount
+
+
+# ===== YouTube: кэш видео и учёт квоты =====
+
+
+@observe("sqlite")
+def get_youtube_cache(hero: str) -> Optional[YouTubeVideoCache]:
+    with Session(engine) as s:
+        return s.get(YouTubeVideoCache, hero)
+
+
+@observe("sqlite")
+def save_youtube_cache(hero: str, video_json: Optional[str], fetched_at: float):
+    with Session(engine) as s:
+        s.merge(YouTubeVideoCache(hero=hero, video_json=video_json, fetched_at=fetched_at))
+        s.commit()
+
+
+@observe("sqlite")
+def list_youtube_videos() -> List[YouTubeVideo]:
+    with Session(engine) as s:
+        return list(s.exec(select(YouTubeVideo).order_by(YouTubeVideo.published_at.desc())))
+
+
+@observe("sqlite")
+def save_youtube_videos(videos: List[dict], synced_at: float) -> int:
+    if not videos:
+        return 0
+    rows = [{**v, "synced_at": synced_at} for v in videos]
+    stmt = sqlite_insert(YouTubeVideo)
+    stmt = stmt.on_conflict_do_update(index_elements=["video_id"], set_={
+        "title": stmt.excluded.title,
+        "published_at": stmt.excluded.published_at,
+        "synced_at": stmt.excluded.synced_at,
+    })
+    with engine.begin() as conn:
+        conn.execute(stmt, rows)
+    return len(rows)
+
+
+@observe("sqlite")
+def add_youtube_quota(day: str, call_type: str, units: int):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO youtubequotausage (day, call_type, calls, units)
+            VALUES (:day, :call_type, 1, :units)
+            ON CONFLICT(day, call_type) DO UPDATE SET
+                calls = youtubequotausage.calls + 1,
+                units = youtubequotausage.units + excluded.units
+        """), {"day": day, "call_type": call_type, "units": units})
+
+
+@observe("sqlite")
+def get_youtube_quota(day: str) -> List[YouTubeQuotaUsage]:
+    with Session(engine) as s:
+        return list(s.exec(select(YouTubeQuotaUsage).where(YouTubeQuotaUsage.day == day)))
+
+
+def get_sqlite_settings() -> dict:
+    names = ["journal_mode", "synchronous", "mmap_size", "cache_size", "busy_timeout"]
+    with engine.connect() as conn:
+        settings = {n: conn.exec_driver_sql(f"PRAGMA {n}").scalar() for n in names}
+    return {"profile": SQLITE_PROFILE, "pool_size": SQLITE_POOL_SIZE,
+            "max_overflow": SQLITE_MAX_OVERFLOW, **settings}
+
+
 def get_db_path() -> str:
     """Return absolute path to the SQLite DB file for diagnostics."""
     return str(DB_PATH.resolve())
@@ -0,0 +1,18 @@
+# backend/env.py
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+
+def load_env():
+    candidates = [
+        Path(__file__).parent / ".env",          # backend/.env
+        Path.cwd() / ".env",                      # текущая папка запуска
+        Path(__file__).parent.parent / ".env",    # корень проекта
+    ]
+    for p in candidates:
+        if p.exists():
+            load_dotenv(dotenv_path=p, override=True)
+            print(f"[ENV] loaded {p}")
+            return
+    print("[ENV] .env not found in", candidates)
@@ -0,0 +1,52 @@
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from heroes import HEROES, HERO_ALIASES
+
+# Поиск героев в произвольном тексте (названия видео). Имена заранее
+# разбиты на токены; совпадение — непрерывная последовательность токенов,
+# длинные имена проверяются раньше коротких: "Yi Sun-Shin" не даёт ещё и "Sun".
+
+_TOKEN = re.compile(r"[0-9a-zа-яё]+")
+
+
+def tokens(text: str) -> Tuple[str, ...]:
+    # "X.Borg" -> ("x", "borg"), "Chang'e" -> ("chang", "e"), "Yi Sun-Shin" -> ("yi", "sun", "shin")
+    return tuple(_TOKEN.findall(text.lower()))
+
+
+class HeroNameIndex:
+    def __init__(self, roster: Sequence[str] = HEROES, aliases: Mapping[str, Iterable[str]] = HERO_ALIASES):
+        self._by_first: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        self._by_name: Dict[Tuple[str, ...], str] = {}
+        for hero in roster:
+            for name in (hero, *aliases.get(hero, ())):
+                toks = tokens(name)
+                if toks:
+                    self._by_first.setdefault(toks[0], []).append((toks, hero))
+                    self._by_name.setdefault(toks, hero)
+        for candidates in self._by_first.values():
+            candidates.sort(key=lambda c: -len(c[0]))
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Roster name for a user-typed hero name or alias ("fanny", "popol & kupa", "YSS")."""
+        return self._by_name.get(tokens(name))
+
+    def match(self, text: str) -> List[str]:
+        """Heroes mentioned in text, in order of first mention."""
+        toks = tokens(text)
+        found: List[str] = []
+        i = 0
+        while i < len(toks):
+            step = 1
+            for name, hero in self._by_first.get(toks[i], ()):
+                if toks[i:i + len(name)] == name:
+                    if hero not in found:
+                        found.append(hero)
+                    step = len(name)
+                    break
+            i += step
+        return found
+
+
+hero_names = HeroNameIndex()
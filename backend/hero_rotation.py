@@ -0,0 +1,150 @@
+import os
+import random
+import secrets
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from heroes import HEROES
+from db import (
+    get_used_heroes, get_used_heroes_async,
+    mark_hero_used, mark_hero_used_async,
+    reserve_random_hero, reserve_random_hero_async,
+    release_hero_reservation, release_hero_reservation_async,
+    reset_heroes, reset_heroes_async,
+    HeroReservation,
+)
+
+# сколько секунд держится бронь героя, выбранного под пост
+HERO_RESERVATION_TTL = float(os.getenv("HERO_RESERVATION_TTL", "900"))
+
+# Ротация героев в памяти процесса. SQLite (UsedHero) остаётся источником
+# истины: запись идёт сначала в БД, затем в память (write-through), а при
+# старте состояние собирается из БД заново.
+
+
+class HeroRotation:
+    def __init__(self, roster: Sequence[str] = HEROES):
+        self._roster = list(roster)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._used: Set[str] = set()
+        # невыбранные герои + позиция каждого: random.choice и удаление за O(1)
+        self._remaining: List[str] = []
+        self._pos: Dict[str, int] = {}
+        self._remaining_snapshot: Optional[Tuple[str, ...]] = None
+        # версия состояния для ETag: id запуска + счётчик записей (после рестарта счётчик с нуля)
+        self._boot_id = secrets.token_hex(4)
+        self._version = 0
+
+    def load(self):
+        used = get_used_heroes()
+        with self._lock:
+            self._rebuild(used)
+
+    async def load_async(self):
+        used = await get_used_heroes_async()
+        with self._lock:
+            self._rebuild(used)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def _rebuild(self, used: Sequence[str]):
+        self._used = set(used)
+        self._remaining = [h for h in self._roster if h not in self._used]
+        self._pos = {h: i for i, h in enumerate(self._remaining)}
+        self._remaining_snapshot = None
+        self._version += 1
+        self._loaded = True
+
+    def _take(self, hero: str):
+        i = self._pos.pop(hero, None)
+        if i is None:
+            return
+        last = self._remaining.pop()
+        if last != hero:
+            self._remaining[i] = last
+            self._pos[last] = i
+        self._remaining_snapshot = None
+        self._version += 1
+
+    # ===== Чтение =====
+
+    def pick(self) -> Optional[str]:
+        self._ensure_loaded()
+        with self._lock:
+            return random.choice(self._remaining) if self._remaining else None
+
+    def remaining(self) -> Tuple[str, ...]:
+        # в порядке ростера, как раньше; пересчитывается только после записи
+        self._ensure_loaded()
+        with self._lock:
+            if self._remaining_snapshot is None:
+                left = set(self._remaining)
+                self._remaining_snapshot = tuple(h for h in self._roster if h in left)
+            return self._remaining_snapshot
+
+    def version(self) -> str:
+        # меняется при каждой записи в ротацию — дешёвый ETag для /heroes/remaining
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._boot_id}-{self._version}"
+
+    def counts(self) -> Dict[str, int]:
+        self._ensure_loaded()
+        with self._lock:
+            return {"remaining": len(self._remaining), "used": len(self._used), "total": len(self._roster)}
+
+    def is_used(self, hero: str) -> bool:
+        self._ensure_loaded()
+        with self._lock:
+            return hero in self._used
+
+    # ===== Запись (write-through) =====
+
+    def mark_used(self, hero: str, ts: str, reservation_token: Optional[str] = None, override: bool = False) -> str:
+        # "ok" / "used" / "reserved" — см. db.mark_hero_used
+        self._ensure_loaded()
+        return self._after_mark(hero, mark_hero_used(hero, ts, reservation_token, override))
+
+    async def mark_used_async(self, hero: str, ts: str, reservation_token: Optional[str] = None,
+                              override: bool = False) -> str:
+        if not self._loaded:
+            await self.load_async()
+        return self._after_mark(hero, await mark_hero_used_async(hero, ts, reservation_token, override))
+
+    def _after_mark(self, hero: str, status: str) -> str:
+        if status in ("ok", "used"):
+            # "used": героя мог отметить другой процесс — догоняем состояние
+            with self._lock:
+                self._used.add(hero)
+                self._take(hero)
+        return status
+
+    def reserve(self, ttl_seconds: float = HERO_RESERVATION_TTL) -> Optional[HeroReservation]:
+        # выбор и бронь — одной операцией в SQLite, чтобы два админа не получили одного героя
+        return reserve_random_hero(self._roster, ttl_seconds, datetime.now(timezone.utc).isoformat())
+
+    async def reserve_async(self, ttl_seconds: float = HERO_RESERVATION_TTL) -> Optional[HeroReservation]:
+        return await reserve_random_hero_async(self._roster, ttl_seconds, datetime.now(timezone.utc).isoformat())
+
+    def release(self, token: str) -> Optional[str]:
+        return release_hero_reservation(token)
+
+    async def release_async(self, token: str) -> Optional[str]:
+        return await release_hero_reservation_async(token)
+
+    def reset(self):
+        reset_heroes()
+        with self._lock:
+            self._rebuild([])
+
+    async def reset_async(self):
+        await reset_heroes_async()
+        with self._lock:
+            self._rebuild([])
+
+
+hero_rotation = HeroRotation()
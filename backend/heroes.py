@@ -16,3 +16,13 @@ HEROES = [
     "Valir", "Vexana", "Wanwan", "X.Borg", "Xavier", "Yin", "Yi Sun-Shin", "Yu Zhong",
     "Zhask", "Zilong", "Zetian", "Obsidia"
 ]
+
+# Как героев пишут в названиях видео помимо официального имени.
+# Пунктуация и регистр не важны: "Yi Sun-Shin" и "yi sun shin" совпадают и так.
+HERO_ALIASES = {
+    "Popol and Kupa": ["Popol & Kupa", "Popol Kupa", "Popol"],
+    "Yi Sun-Shin": ["YSS", "YiSunShin"],
+    "X.Borg": ["XBorg"],
+    "Lapu-Lapu": ["Lapulapu"],
+    "Yu Zhong": ["YuZhong"],
+}
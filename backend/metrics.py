@@ -0,0 +1,106 @@
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# от быстрых SQLite-запросов до долгих генераций Gemini
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "mlbb_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+DEPENDENCY_LATENCY = Histogram(
+    "mlbb_dependency_call_duration_seconds",
+    "Latency of calls to Gemini, YouTube and SQLite",
+    ["dependency", "operation", "outcome"],
+    buckets=_BUCKETS,
+)
+FALLBACKS = Counter(
+    "mlbb_ai_fallbacks_total",
+    "AI answers replaced by the hardcoded fallback text",
+    ["kind"],
+)
+YOUTUBE_QUOTA = Counter(
+    "mlbb_youtube_quota_units_total",
+    "YouTube Data API quota units spent by call type",
+    ["call_type"],
+)
+
+# ===== Зависимости =====
+
+
+@contextmanager
+def track(dependency: str, operation: str):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        DEPENDENCY_LATENCY.labels(dependency, operation, outcome).observe(time.perf_counter() - start)
+
+
+def observe(dependency: str, operation: Optional[str] = None):
+    """Decorator: time a sync or async function as a dependency call."""
+    def wrap(fn: Callable):
+        op = operation or fn.__name__
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with track(dependency, op):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(dependency, op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return wrap
+
+
+def count_fallback(kind: str):
+    FALLBACKS.labels(kind).inc()
+
+
+def count_youtube_quota(call_type: str, units: int):
+    YOUTUBE_QUOTA.labels(call_type).inc(units)
+
+# ===== HTTP =====
+
+
+class MetricsMiddleware:
+    """ASGI middleware: per-route latency histogram (label is the route template)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # неизвестные пути не превращаем в отдельные метки
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status["code"])).observe(
+                time.perf_counter() - start)
+
+
+def render_latest():
+    return generate_latest(), CONTENT_TYPE_LATEST
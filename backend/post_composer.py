@@ -0,0 +1,105 @@
+import os
+import asyncio
+import time
+from typing import Dict, List
+
+from ai_client import generate_hero_post_async, HERO_POST_FALLBACK
+from youtube_client import find_video_for_hero, QuotaExhausted
+from hero_rotation import hero_rotation
+
+# Видео (YouTube, sync-клиент — в потоке) и текст (Gemini) ищутся параллельно
+# под одним общим дедлайном: задержка поста — max, а не сумма двух вызовов.
+# Без видео поста нет; если не успел текст — пост уходит с запасным текстом.
+POST_COMPOSE_DEADLINE = float(os.getenv("POST_COMPOSE_DEADLINE", "20"))  # сек на один пост
+# сколько постов пачки собирается одновременно: YouTube-вызовы идут через общий
+# пул потоков, и очередь в нём не должна съедать дедлайн каждого поста
+POST_COMPOSE_CONCURRENCY = int(os.getenv("POST_COMPOSE_CONCURRENCY", "4"))
+# черновики на неделю вперёд: бронь держится, пока посты не опубликованы
+POST_BATCH_RESERVATION_TTL = float(os.getenv("POST_BATCH_RESERVATION_TTL", str(8 * 24 * 3600)))
+
+
+class NoVideoFound(LookupError):
+    pass
+
+
+class ComposeTimeout(TimeoutError):
+    pass
+
+
+async def compose_post_async(hero: str, deadline: float = POST_COMPOSE_DEADLINE) -> Dict:
+    started = time.monotonic()
+    video_task = asyncio.ensure_future(asyncio.to_thread(find_video_for_hero, hero))
+    text_task = asyncio.ensure_future(generate_hero_post_async(hero))
+    try:
+        done, _ = await asyncio.wait({video_task}, timeout=deadline)
+        if not done:
+            raise ComposeTimeout(f"YouTube lookup for {hero} took longer than {deadline}s")
+        video = video_task.result()  # QuotaExhausted и ошибки API — наверх
+        if not video:
+            raise NoVideoFound(hero)
+        left = max(0.0, deadline - (time.monotonic() - started))
+        done, _ = await asyncio.wait({text_task}, timeout=left)
+        text_fallback = not done
+        text = text_task.result() if done else HERO_POST_FALLBACK.format(hero=hero)
+    finally:
+        # без видео текст не нужен; генерация под singleflight shield всё равно досчитается в кэш
+        for task in (video_task, text_task):
+            if not task.done():
+                task.cancel()
+    return {
+        "hero": hero,
+        "video_title": video["title"],
+        "video_url": video["url"],
+        "post_text": text + f"\n{video['url']}",
+        "text_fallback": text_fallback,
+    }
+
+
+async def _compose_reserved(reservation, slots: asyncio.Semaphore) -> Dict:
+    try:
+        async with slots:  # дедлайн поста отсчитывается с момента, когда он получил слот
+            post = await compose_post_async(reservation.hero)
+    except BaseException:
+        # черновик не получился — герой возвращается в ротацию, а не висит в брони неделю
+        await hero_rotation.release_async(reservation.token)
+        raise
+    post["reservation_id"] = reservation.token
+    post["expires_at"] = reservation.expires_at
+    return post
+
+
+async def compose_batch_async(n: int) -> Dict:
+    # бронируем n героев и собираем посты параллельно; неудачных заменяем
+    # новыми бронями, пока не кончатся попытки или герои
+    posts: List[Dict] = []
+    skipped: List[Dict] = []
+    exhausted = False
+    slots = asyncio.Semaphore(POST_COMPOSE_CONCURRENCY)
+    for _ in range(3):
+        need = n - len(posts)
+        if need <= 0 or exhausted:
+            break
+        reservations = []
+        for _ in range(need):
+            r = await hero_rotation.reserve_async(POST_BATCH_RESERVATION_TTL)
+            if r is None:
+                exhausted = True
+                break
+            reservations.append(r)
+        if not reservations:
+            break
+        results = await asyncio.gather(*(_compose_reserved(r, slots) for r in reservations), return_exceptions=True)
+        for r, res in zip(reservations, results):
+            if isinstance(res, QuotaExhausted):
+                exhausted = True
+                skipped.append({"hero": r.hero, "reason": "youtube_quota"})
+            elif isinstance(res, NoVideoFound):
+                skipped.append({"hero": r.hero, "reason": "no_video"})
+            elif isinstance(res, ComposeTimeout):
+                skipped.append({"hero": r.hero, "reason": "timeout"})
+            elif isinstance(res, BaseException):
+                print("[ERROR] compose batch:", r.hero, repr(res))
+                skipped.append({"hero": r.hero, "reason": "error"})
+            else:
+                posts.append(res)
+    return {"requested": n, "composed": len(posts), "posts": posts, "skipped": skipped}
@@ -0,0 +1,27 @@
+# precompute_counter_picks.py
+# Пакетный предрасчёт контр-пиков для всего ростера (например, из cron после патча).
+#
+#   cd backend && python precompute_counter_picks.py          # только новые/устаревшие
+#   cd backend && python precompute_counter_picks.py --full   # пересчитать всё
+import asyncio
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# .env нужно загрузить до импорта ai_client — он читает ключ при импорте
+load_dotenv(dotenv_path=Path(__file__).parent / ".env", override=True)
+
+from db import init_db  # noqa: E402
+from counter_picks import counter_pick_table  # noqa: E402
+
+
+async def main(full: bool):
+    init_db()
+    counter_pick_table.load()
+    result = await counter_pick_table.refresh(full=full)
+    print(result, counter_pick_table.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main("--full" in sys.argv[1:]))
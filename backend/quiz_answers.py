@@ -0,0 +1,126 @@
+import os
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from db import record_quiz_answers_async
+
+# Ответы пользователей копятся в памяти и пишутся в SQLite пачками
+# (одна транзакция на пачку): по размеру буфера или раз в интервал.
+# Рейтинг (QuizScore) обновляется в той же транзакции — отстаёт не больше
+# чем на ANSWER_FLUSH_INTERVAL.
+ANSWER_FLUSH_SIZE = int(os.getenv("ANSWER_FLUSH_SIZE", "200"))
+ANSWER_FLUSH_INTERVAL = float(os.getenv("ANSWER_FLUSH_INTERVAL", "2"))
+# если SQLite недоступен — держим не больше стольких ответов, старые отбрасываем
+ANSWER_BUFFER_MAX = int(os.getenv("ANSWER_BUFFER_MAX", "20000"))
+# после неудачной записи ждём (ANSWER_FLUSH_INTERVAL, x2, x4 ... до этого потолка), а не повторяем сразу
+ANSWER_RETRY_MAX = float(os.getenv("ANSWER_RETRY_MAX", "60"))
+
+
+class AnswerRecorder:
+    def __init__(self):
+        self._buffer: List[Dict] = []
+        self._flushing: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.counted = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self._retry_delay = 0.0
+        self._retry_at = 0.0  # time.monotonic(), раньше которого после ошибки не пишем
+
+    def record(self, user_id: int, username: Optional[str], quiz_id: int, correct: bool):
+        # без I/O: маршрут отвечает сразу, запись уйдёт со следующей пачкой
+        self._buffer.append({
+            "user_id": user_id,
+            "username": username,
+            "quiz_id": quiz_id,
+            "correct": bool(correct),
+            "answered_at": datetime.now(timezone.utc).isoformat(),
+        })
+        self.recorded += 1
+        self._trim()
+        if len(self._buffer) >= ANSWER_FLUSH_SIZE:
+            self.trigger()
+
+    def _trim(self):
+        # буфер не растёт без предела: отбрасываем самые старые ответы
+        if len(self._buffer) > ANSWER_BUFFER_MAX:
+            over = len(self._buffer) - ANSWER_BUFFER_MAX
+            del self._buffer[:over]
+            self.dropped += over
+
+    def trigger(self):
+        # одна запись за раз: новые ответы дождутся следующей пачки
+        if self._flushing is not None or not self._buffer:
+            return
+        if time.monotonic() < self._retry_at:
+            return  # SQLite недавно не принял пачку — ждём backoff
+        self._flushing = asyncio.ensure_future(self.flush())
+        self._flushing.add_done_callback(self._flush_done)
+
+    def _flush_done(self, _task: asyncio.Task):
+        self._flushing = None
+        if len(self._buffer) >= ANSWER_FLUSH_SIZE:
+            self.trigger()
+
+    async def flush(self):
+        batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self.counted += await record_quiz_answers_async(batch)
+            self.flushes += 1
+            self._retry_delay = 0.0
+            self._retry_at = 0.0
+        except Exception as e:
+            print("[ERROR] quiz answers flush:", e)
+            self.errors += 1
+            self._retry_delay = min(ANSWER_RETRY_MAX, max(ANSWER_FLUSH_INTERVAL, self._retry_delay * 2))
+            self._retry_at = time.monotonic() + self._retry_delay
+            # возвращаем пачку в начало буфера — попробуем после backoff; лимит буфера соблюдаем
+            self._buffer[:0] = batch
+            self._trim()
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(ANSWER_FLUSH_INTERVAL)
+            self.trigger()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # после каждой пачки _flush_done может запустить следующую — ждём, пока не останется ни одной
+        while self._flushing is not None:
+            await asyncio.gather(self._flushing, return_exceptions=True)
+            await asyncio.sleep(0)
+        # остаток буфера не теряем при остановке
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "buffered": len(self._buffer),
+            "flush_size": ANSWER_FLUSH_SIZE,
+            "flush_interval": ANSWER_FLUSH_INTERVAL,
+            "recorded": self.recorded,
+            "counted": self.counted,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "retry_in": round(max(0.0, self._retry_at - time.monotonic()), 2),
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+answer_recorder = AnswerRecorder()
@@ -0,0 +1,124 @@
+import os
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from db import save_quizzes_async, count_unserved_quizzes_async, pop_unserved_quiz_async
+from ai_client import generate_quizzes_async, is_fallback_quiz, QUIZ_BATCH_MAX
+
+# Пул заранее сгенерированных вопросов: /quiz/generate берёт готовый вопрос
+# из SQLite, а фоновый refiller держит в каждой корзине (topic, difficulty)
+# QUIZ_POOL_SIZE невыданных вопросов.
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "20"))
+QUIZ_POOL_LOW_WATERMARK = int(os.getenv("QUIZ_POOL_LOW_WATERMARK", "5"))
+QUIZ_POOL_INTERVAL = int(os.getenv("QUIZ_POOL_INTERVAL", "300"))  # сек между плановыми проверками
+# темы через запятую; общая тема (без topic) есть всегда
+QUIZ_POOL_TOPICS = [t for t in (
+    x.strip().lower() for x in os.getenv("QUIZ_POOL_TOPICS", "").split(",")) if t]
+QUIZ_DIFFICULTIES = ("easy", "medium", "hard")
+
+Bucket = Tuple[Optional[str], str]
+
+
+def normalize_topic(topic: Optional[str]) -> Optional[str]:
+    topic = (topic or "").strip().lower()
+    return topic or None
+
+
+class QuizPool:
+    def __init__(self):
+        self.buckets: List[Bucket] = [
+            (topic, d) for topic in [None, *QUIZ_POOL_TOPICS] for d in QUIZ_DIFFICULTIES
+        ]
+        self._refills: Dict[Bucket, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.served = 0
+        self.misses = 0
+        self.generated = 0
+
+    @property
+    def enabled(self) -> bool:
+        return QUIZ_POOL_SIZE > 0
+
+    async def take(self, topic: Optional[str], difficulty: str) -> Optional[Dict]:
+        bucket = (topic, difficulty)
+        if not self.enabled or bucket not in self.buckets:
+            return None
+        now = datetime.now(timezone.utc).isoformat()
+        q, remaining = await pop_unserved_quiz_async(topic, difficulty, now)
+        if remaining < QUIZ_POOL_LOW_WATERMARK:
+            self.trigger(bucket)
+        if q is None:
+            self.misses += 1
+            return None
+        self.served += 1
+        return {
+            "quiz_id": q.id,
+            "question": q.question,
+            "options": q.options,
+            "correct_index": q.correct_index,
+            "explanation": q.explanation,
+        }
+
+    def trigger(self, bucket: Bucket):
+        # не больше одного refill на корзину одновременно
+        if bucket in self._refills:
+            return
+        task = asyncio.ensure_future(self._refill(bucket))
+        self._refills[bucket] = task
+        task.add_done_callback(lambda _t: self._refills.pop(bucket, None))
+
+    async def _refill(self, bucket: Bucket):
+        topic, difficulty = bucket
+        try:
+            have = await count_unserved_quizzes_async(topic, difficulty)
+            while have < QUIZ_POOL_SIZE:
+                # вопросы пачками: один вызов Gemini и одна транзакция на QUIZ_BATCH_MAX вопросов
+                n = min(QUIZ_POOL_SIZE - have, QUIZ_BATCH_MAX)
+                batch = await generate_quizzes_async(n, topic=topic, difficulty=difficulty)
+                batch = [q for q in batch if not is_fallback_quiz(q)]
+                if not batch:
+                    # Gemini недоступен — заглушку в пул не кладём, попробуем в следующий раз
+                    break
+                await save_quizzes_async(
+                    batch,
+                    created_at=datetime.now(timezone.utc).isoformat(),
+                    topic=topic,
+                    difficulty=difficulty,
+                    served=False,
+                )
+                self.generated += len(batch)
+                have += len(batch)
+        except Exception as e:
+            print("[ERROR] quiz pool refill", bucket, e)
+
+    async def _run(self):
+        while True:
+            for bucket in self.buckets:
+                self.trigger(bucket)
+            await asyncio.sleep(QUIZ_POOL_INTERVAL)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._refills.values()] if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "size": QUIZ_POOL_SIZE,
+            "low_watermark": QUIZ_POOL_LOW_WATERMARK,
+            "buckets": len(self.buckets),
+            "refilling": len(self._refills),
+            "served": self.served,
+            "misses": self.misses,
+            "generated": self.generated,
+        }
+
+
+quiz_pool = QuizPool()
@@ -0,0 +1,35 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Одинаковые по ключу одновременные вызовы ждут одну общую задачу."""
+
+    def __init__(self):
+        self._inflight: Dict[str, "asyncio.Task"] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._forget(key, _t))
+        else:
+            self.shared += 1
+        # shield: если клиент-«лидер» отвалился, остальные всё равно дождутся результата
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: "asyncio.Task"):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "shared": self.shared}
+
+
+inflight = SingleFlight()
@@ -0,0 +1,38 @@
+# test_counter_pick_fallback.py
+# Без ключа Gemini контр-пик — запасной текст. Он не должен попасть в таблицу
+# предрасчёта ни при каком написании героя: "fanny", алиас "YSS", "x borg".
+#
+#   cd backend && python test_counter_pick_fallback.py
+import os
+import asyncio
+import tempfile
+
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "test.sqlite3")
+
+import ai_client  # noqa: E402
+from db import init_db, list_counter_picks  # noqa: E402
+from counter_picks import CounterPickTable  # noqa: E402
+
+NAMES = ["fanny", "Fanny", "YSS", "x borg"]
+
+
+async def _collect(stream) -> str:
+    return "".join([piece async for piece in stream])
+
+
+def test_fallback_is_not_stored():
+    ai_client.GEMINI_API_KEY = None  # как при пустом .env: сразу запасной текст
+    init_db()
+    table = CounterPickTable()
+    for name in NAMES:
+        text = asyncio.run(table.answer(name))
+        assert ai_client.is_fallback_counter_pick(name, text), text
+        text = asyncio.run(_collect(table.answer_stream(name)))
+        assert ai_client.is_fallback_counter_pick(name, text), text
+    assert table.get("Fanny") is None
+    assert list_counter_picks() == []
+
+
+if __name__ == "__main__":
+    test_fallback_is_not_stored()
+    print("OK: fallback answers are not stored for", NAMES)
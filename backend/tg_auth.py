@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from fastapi import Header, HTTPException
+
+# Проверка Telegram initData и короткие сессии поверх неё.
+# /tg/verify проверяет initData (HMAC от секрета бота) один раз и выдаёт
+# подписанный токен; остальные маршруты проверяют только его —
+# один HMAC по короткой строке, без разбора initData.
+TG_AUTH_MAX_AGE = int(os.getenv("TG_AUTH_MAX_AGE", "86400"))  # сек; 0 — не проверять auth_date
+TG_SESSION_TTL = int(os.getenv("TG_SESSION_TTL", "3600"))
+TG_VERIFY_CACHE_SIZE = int(os.getenv("TG_VERIFY_CACHE_SIZE", "4096"))
+# true — маршруты Mini App без сессии отвечают 401; по умолчанию сессия необязательна,
+# чтобы фронтенд работал и в обычном браузере без Telegram (dev)
+TG_REQUIRE_SESSION = os.getenv("TG_REQUIRE_SESSION", "false").lower() == "true"
+
+
+@lru_cache(maxsize=4)
+def _bot_secret(bot_token: str) -> bytes:
+    # считается один раз на токен бота, а не на каждый запрос
+    return hashlib.sha256(bot_token.encode()).digest()
+
+
+@lru_cache(maxsize=4)
+def _session_secret(bot_token: str) -> bytes:
+    # TG_SESSION_SECRET — чтобы сессии переживали смену токена бота; иначе выводим из него
+    explicit = os.getenv("TG_SESSION_SECRET")
+    if explicit:
+        return explicit.encode()
+    return hmac.new(_bot_secret(bot_token), b"mlbb-session", hashlib.sha256).digest()
+
+
+def _bot_token() -> str:
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        raise HTTPException(503, "TELEGRAM_BOT_TOKEN is not configured")
+    return token
+
+
+# ===== initData =====
+
+
+class _VerifiedCache:
+    # sha256(init_data) -> (поля, годен до); повторная проверка той же строки — поиск в словаре
+    def __init__(self, size: int):
+        self._size = size
+        self._items: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[Dict[str, str]]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[1] < time.time():
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: bytes, data: Dict[str, str], valid_until: float):
+        if self._size <= 0:
+            return
+        with self._lock:
+            self._items[key] = (data, valid_until)
+            self._items.move_to_end(key)
+            while len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"size": len(self._items), "max_size": self._size, "hits": self.hits, "misses": self.misses}
+
+
+verified_cache = _VerifiedCache(TG_VERIFY_CACHE_SIZE)
+
+
+def _auth_age(data: Dict[str, str]) -> float:
+    try:
+        return time.time() - int(data.get("auth_date", ""))
+    except ValueError:
+        raise HTTPException(400, "Missing auth_date in init_data")
+
+
+def verify_init_data(init_data: str) -> Dict[str, str]:
+    token = _bot_token()
+    key = hashlib.sha256(init_data.encode()).digest()
+    data = verified_cache.get(key)
+    if data is not None:
+        return dict(data)
+    # Parse URL-encoded init_data string into dict of first values
+    q = parse_qs(init_data, keep_blank_values=True)
+    data = {k: v[0] for k, v in q.items()}
+    recv_hash = data.pop("hash", None)
+    if not recv_hash:
+        raise HTTPException(400, "Missing hash in init_data")
+    # Build data_check_string
+    data_check_string = "\n".join(f"{k}={data[k]}" for k in sorted(data.keys()))
+    calc_hash = hmac.new(_bot_secret(token), msg=data_check_string.encode(), digestmod=hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(calc_hash, recv_hash):
+        raise HTTPException(401, "Invalid init_data hash")
+    valid_until = float("inf")
+    if TG_AUTH_MAX_AGE > 0:
+        age = _auth_age(data)
+        if age > TG_AUTH_MAX_AGE:
+            raise HTTPException(401, "init_data is expired")
+        valid_until = time.time() + TG_AUTH_MAX_AGE - age
+    verified_cache.put(key, data, valid_until)
+    return dict(data)
+
+
+def init_data_user(data: Dict[str, str]) -> Optional[Dict]:
+    # user приходит JSON-строкой (спецификация Telegram)
+    user = json.loads(data.get("user") or "null")
+    if not isinstance(user, dict) or "id" not in user:
+        return None
+    return user
+
+
+# ===== Сессии =====
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def issue_session(user: Dict) -> Dict:
+    exp = int(time.time()) + TG_SESSION_TTL
+    payload = _b64(json.dumps({
+        "uid": int(user["id"]),
+        "name": user.get("username") or user.get("first_name"),
+        "exp": exp,
+    }, ensure_ascii=False, separators=(",", ":")).encode())
+    sig = _b64(hmac.new(_session_secret(_bot_token()), payload.encode(), hashlib.sha256).digest())
+    return {"session_token": f"{payload}.{sig}", "expires_at": exp}
+
+
+def read_session(token: str) -> Optional[Dict]:
+    # None — подпись не сошлась, токен испорчен или истёк
+    payload, _, sig = token.partition(".")
+    if not sig:
+        return None
+    expected = _b64(hmac.new(_session_secret(_bot_token()), payload.encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected, sig):
+        return None
+    try:
+        data = json.loads(_unb64(payload))
+    except ValueError:
+        return None
+    if data.get("exp", 0) < time.time():
+        return None
+    return data
+
+
+def tg_session(authorization: Optional[str] = Header(None)) -> Optional[Dict]:
+    """Dependency: the session from `Authorization: Bearer <token>`, or None if not sent."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(401, "Bearer session token expected")
+    session = read_session(token.strip())
+    if session is None:
+        raise HTTPException(401, "Invalid or expired session token")
+    return session
+
+
+def require_tg_session(authorization: Optional[str] = Header(None)) -> Dict:
+    session = tg_session(authorization)
+    if session is None:
+        raise HTTPException(401, "Session token required: call /tg/verify first")
+    return session
@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from db import list_tier_lists, list_tier_lists_async, save_tier_list_async, clear_tier_lists_async
+from ai_client import generate_tier_list_async
+from singleflight import inflight
+
+# Tier list меняется раз в патч: отдаём сохранённый сразу, а устаревший
+# (старше TIER_LIST_FRESH_SECONDS) — тоже сразу, обновляя его в фоне.
+TIER_LIST_FRESH_SECONDS = int(os.getenv("TIER_LIST_FRESH_SECONDS", "21600"))
+# старше этого — уже не отдаём, ждём новую генерацию
+TIER_LIST_MAX_STALE_SECONDS = int(os.getenv("TIER_LIST_MAX_STALE_SECONDS", "604800"))
+
+
+def _norm(value: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", value or "").strip().casefold()
+
+
+def make_key(role: Optional[str], lane: Optional[str], skill: Optional[str], note: Optional[str]) -> str:
+    return "|".join(_norm(v) for v in (role, lane, skill, note))
+
+
+def _is_usable(data: Dict) -> bool:
+    # fallback из generate_tier_list — пустые тиры с сырым текстом в notes
+    return any(data.get(k) for k in ("S", "A", "B"))
+
+
+class TierListCache:
+    def __init__(self):
+        self._items: Dict[str, Tuple[Dict, float]] = {}  # key -> (data, updated_at)
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._epoch = 0  # растёт при invalidate: результаты старых генераций не сохраняем
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def load(self):
+        self._fill(list_tier_lists())
+
+    async def load_async(self):
+        self._fill(await list_tier_lists_async())
+
+    def _fill(self, rows: List):
+        items = {}
+        for row in rows:
+            try:
+                items[row.key] = (json.loads(row.data_json), row.updated_at)
+            except Exception:
+                continue
+        self._items = items
+
+    async def get(self, role: Optional[str] = None, lane: Optional[str] = None, skill: Optional[str] = None,
+                  note: Optional[str] = None, fresh: bool = False) -> Dict:
+        key = make_key(role, lane, skill, note)
+        filters = (role, lane, skill, note)
+        item = None if fresh else self._items.get(key)
+        if item is not None:
+            data, updated_at = item
+            age = time.time() - updated_at
+            if age < TIER_LIST_FRESH_SECONDS:
+                self.hits += 1
+                return data
+            if age < TIER_LIST_MAX_STALE_SECONDS:
+                self.stale_hits += 1
+                self._revalidate(key, filters)
+                return data
+        self.misses += 1
+        if fresh:
+            return await self._generate(key, filters, fresh=True)
+        return await inflight.do(f"tier:{key}", lambda: self._generate(key, filters))
+
+    def _revalidate(self, key: str, filters: Tuple):
+        if key in self._refreshes:
+            return
+        task = asyncio.ensure_future(self._generate_safe(key, filters))
+        self._refreshes[key] = task
+        task.add_done_callback(lambda _t: self._refreshes.pop(key, None))
+
+    async def _generate_safe(self, key: str, filters: Tuple):
+        try:
+            await self._generate(key, filters, fresh=True)
+        except Exception as e:
+            print("[ERROR] tier list refresh:", e)
+
+    async def _generate(self, key: str, filters: Tuple, fresh: bool = False) -> Dict:
+        epoch = self._epoch
+        role, lane, skill, note = filters
+        data = await generate_tier_list_async(role=role, lane=lane, skill=skill, note=note, fresh=fresh)
+        if _is_usable(data) and epoch == self._epoch:
+            updated_at = time.time()
+            self._items[key] = (data, updated_at)
+            await save_tier_list_async(key, json.dumps(data, ensure_ascii=False), updated_at)
+        return data
+
+    async def invalidate_all(self) -> int:
+        self._epoch += 1
+        self._items.clear()
+        for task in list(self._refreshes.values()):
+            task.cancel()
+        return await clear_tier_lists_async()
+
+    async def stop(self):
+        tasks = list(self._refreshes.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._items),
+            "fresh_seconds": TIER_LIST_FRESH_SECONDS,
+            "max_stale_seconds": TIER_LIST_MAX_STALE_SECONDS,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshes),
+        }
+
+
+tier_list_cache = TierListCache()
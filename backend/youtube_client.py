@@ -1,15 +1,42 @@
 import os
 import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone, tzinfo
 from typing import Optional, Dict, List
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from metrics import observe, count_youtube_quota
+from db import get_youtube_cache, save_youtube_cache, add_youtube_quota, get_youtube_quota
+from channel_index import channel_index
 
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 YOUTUBE_CHANNEL_ID = os.getenv("YOUTUBE_CHANNEL_ID")
 YOUTUBE_STRICT_CHANNEL = os.getenv("YOUTUBE_STRICT_CHANNEL", "true").lower() in ("1", "true", "yes")
 
+# Кэш найденных видео по герою (SQLite): свежий — отдаём без API,
+# просроченный — отдаём, когда квота на исходе
+YOUTUBE_CACHE_TTL = int(os.getenv("YOUTUBE_CACHE_TTL", str(7 * 24 * 3600)))
+YOUTUBE_NEGATIVE_TTL = int(os.getenv("YOUTUBE_NEGATIVE_TTL", str(24 * 3600)))  # «видео не нашлось»
+
+# Квота YouTube Data API: 10 000 единиц в сутки, сброс в полночь по тихоокеанскому времени
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+YOUTUBE_QUOTA_RESERVE = int(os.getenv("YOUTUBE_QUOTA_RESERVE", "1000"))  # не тратим последние N единиц
+QUOTA_TZ_NAME = "America/Los_Angeles"
+_quota_tz: Optional[tzinfo] = None
+QUOTA_COSTS = {
+    "search.list": 100,
+    "playlistItems.list": 1,
+    "channels.list": 1,
+    "videos.list": 1,
+}
+
 _youtube_service = None
+_uploads_playlist: Optional[str] = None
+
+
+class QuotaExhausted(RuntimeError):
+    """Daily quota budget (minus the reserve) is spent; serve cached data instead."""
 
 
 def _get_service():
@@ -18,40 +45,232 @@ def _get_service():
         return _youtube_service
     if not YOUTUBE_API_KEY:
         raise RuntimeError("Missing YOUTUBE_API_KEY in .env")
+    # discovery-клиент тяжёлый (httplib2, google-auth, JSON-описание API) — грузим при первом вызове
+    from googleapiclient.discovery import build
     _youtube_service = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
     return _youtube_service
 
 
+def _http_error():
+    # для except: выражение вычисляется только когда исключение уже летит,
+    # а к тому моменту googleapiclient загружен вызовом _get_service
+    from googleapiclient.errors import HttpError
+    return HttpError
+
+
+# ===== Квота =====
+
+_quota_lock = threading.Lock()
+_quota = {"day": None, "used": {}, "exhausted": False}  # used: call_type -> [calls, units]
+_cache_stats = {"hits": 0, "stale_hits": 0, "misses": 0}
+
+
+def _quota_timezone() -> tzinfo:
+    # на Windows без пакета tzdata базы часовых поясов нет — считаем по PST (UTC-8);
+    # летом сброс квоты тогда видим на час позже, но YouTube-маршруты не отключаются
+    global _quota_tz
+    if _quota_tz is None:
+        try:
+            _quota_tz = ZoneInfo(QUOTA_TZ_NAME)
+        except ZoneInfoNotFoundError:
+            print(f"[WARN] time zone {QUOTA_TZ_NAME} not found (pip install tzdata) — using UTC-8 for YouTube quota days")
+            _quota_tz = timezone(timedelta(hours=-8), "PST")
+    return _quota_tz
+
+
+def quota_day() -> str:
+    return datetime.now(_quota_timezone()).date().isoformat()
+
+
+def _quota_state(day: str) -> dict:
+    # под _quota_lock; новый тихоокеанский день — счётчики с нуля (или из SQLite после рестарта)
+    if _quota["day"] != day:
+        used = {}
+        try:
+            used = {r.call_type: [r.calls, r.units] for r in get_youtube_quota(day)}
+        except Exception as e:
+            print("[YouTube quota ERROR]", e)
+        _quota.update(day=day, used=used, exhausted=False)
+    return _quota
+
+
+def quota_used() -> int:
+    with _quota_lock:
+        return sum(units for _, units in _quota_state(quota_day())["used"].values())
+
+
+def _spend(call_type: str):
+    # списываем до вызова: YouTube тратит квоту и на неудачные запросы
+    units = QUOTA_COSTS[call_type.split("/")[0]]
+    day = quota_day()
+    with _quota_lock:
+        state = _quota_state(day)
+        used = sum(u for _, u in state["used"].values())
+        if state["exhausted"] or used + units > YOUTUBE_DAILY_QUOTA - YOUTUBE_QUOTA_RESERVE:
+            raise QuotaExhausted(f"YouTube quota budget spent: {used}/{YOUTUBE_DAILY_QUOTA} units")
+        calls, total = state["used"].get(call_type, [0, 0])
+        state["used"][call_type] = [calls + 1, total + units]
+    count_youtube_quota(call_type, units)
+    try:
+        add_youtube_quota(day, call_type, units)
+    except Exception as e:
+        print("[YouTube quota ERROR]", e)
+
+
+def _execute(request, call_type: str):
+    _spend(call_type)
+    try:
+        return request.execute()
+    except _http_error() as e:
+        if e.resp is not None and e.resp.status == 403 and b"quotaExceeded" in (e.content or b""):
+            # YouTube считает иначе, чем мы (другие клиенты того же ключа) — до конца дня не пробуем
+            with _quota_lock:
+                _quota_state(quota_day())["exhausted"] = True
+            raise QuotaExhausted("YouTube reported quotaExceeded")
+        raise
+
+
+def quota_stats() -> Dict:
+    day = quota_day()
+    with _quota_lock:
+        state = _quota_state(day)
+        used = sum(u for _, u in state["used"].values())
+        by_type = {k: {"calls": c, "units": u} for k, (c, u) in sorted(state["used"].items())}
+        exhausted = state["exhausted"]
+    return {
+        "day": day,
+        "used": used,
+        "daily_quota": YOUTUBE_DAILY_QUOTA,
+        "reserve": YOUTUBE_QUOTA_RESERVE,
+        "remaining_budget": max(0, YOUTUBE_DAILY_QUOTA - YOUTUBE_QUOTA_RESERVE - used),
+        "exhausted": exhausted,
+        "by_type": by_type,
+        "cache": dict(_cache_stats),
+    }
+
+# ===== Поиск =====
+
+
 def _search_channel(yt, hero: str, order: str):
-    return (
-        yt.search()
-        .list(
+    return _execute(
+        yt.search().list(
             part="snippet",
             channelId=YOUTUBE_CHANNEL_ID,
             q=hero,
             type="video",
             order=order,
             maxResults=5,
-        )
-        .execute()
+        ),
+        "search.list/channel",
     )
 
 
 def _search_global(yt, q: str, order: str):
-    return (
-        yt.search()
-        .list(
+    return _execute(
+        yt.search().list(
             part="snippet",
             q=q,
             type="video",
             order=order,
             maxResults=5,
-        )
-        .execute()
+        ),
+        "search.list/global",
     )
 
 
+def _cache_key(hero: str) -> str:
+    return " ".join(hero.lower().split())
+
+
+# ===== Индекс канала =====
+# Все загрузки канала читаем через uploads-плейлист: playlistItems.list стоит
+# 1 единицу за 50 видео против 100 единиц за каждый search.list.
+
+def _uploads_playlist_id(yt) -> str:
+    global _uploads_playlist
+    if _uploads_playlist is None:
+        data = _execute(yt.channels().list(part="contentDetails", id=YOUTUBE_CHANNEL_ID), "channels.list")
+        items = data.get("items", [])
+        if not items:
+            raise RuntimeError(f"YouTube channel {YOUTUBE_CHANNEL_ID} not found")
+        _uploads_playlist = items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
+    return _uploads_playlist
+
+
+@observe("youtube")
+def sync_channel_videos(full: bool = False) -> Dict:
+    # инкрементально: плейлист идёт от новых к старым — останавливаемся на
+    # первой странице, где встретилось уже известное видео
+    if not YOUTUBE_CHANNEL_ID:
+        raise RuntimeError("Missing YOUTUBE_CHANNEL_ID in .env")
+    yt = _get_service()
+    started = time.time()
+    playlist = _uploads_playlist_id(yt)
+    videos: List[dict] = []
+    pages = 0
+    token = None
+    while True:
+        data = _execute(
+            yt.playlistItems().list(part="snippet", playlistId=playlist, maxResults=50, pageToken=token),
+            "playlistItems.list",
+        )
+        pages += 1
+        seen_known = False
+        for it in data.get("items", []):
+            snip = it.get("snippet", {})
+            vid = snip.get("resourceId", {}).get("videoId")
+            title = snip.get("title", "")
+            if not vid or title in ("Private video", "Deleted video"):
+                continue
+            if channel_index.known(vid):
+                seen_known = True
+            videos.append({"video_id": vid, "title": title, "published_at": snip.get("publishedAt", "")})
+        token = data.get("nextPageToken")
+        if not token or (seen_known and not full):
+            break
+    new = [v for v in videos if not channel_index.known(v["video_id"])]
+    # при полной синхронизации обновляем и названия уже известных видео
+    channel_index.add(videos if full else new, started)
+    return {"full": full, "pages": pages, "seen": len(videos), "new": len(new),
+            "seconds": round(time.time() - started, 2)}
+
+
+@observe("youtube")
 def find_video_for_hero(hero: str) -> Optional[Dict[str, str]]:
+    video = channel_index.lookup(hero)
+    if video is not None:
+        return video
+    if channel_index.ready and YOUTUBE_CHANNEL_ID and YOUTUBE_STRICT_CHANNEL:
+        # индекс знает все загрузки канала — search.list по каналу ничего нового не найдёт
+        return None
+    key = _cache_key(hero)
+    cached = None
+    try:
+        cached = get_youtube_cache(key)
+    except Exception as e:
+        print("[YouTube cache ERROR]", e)
+    if cached is not None:
+        ttl = YOUTUBE_CACHE_TTL if cached.video_json else YOUTUBE_NEGATIVE_TTL
+        if time.time() - cached.fetched_at < ttl:
+            _cache_stats["hits"] += 1
+            return json.loads(cached.video_json) if cached.video_json else None
+    try:
+        video = _search_video(hero)
+    except QuotaExhausted:
+        if cached is None:
+            raise
+        # бюджет на сегодня потрачен — лучше устаревшее видео, чем никакого
+        _cache_stats["stale_hits"] += 1
+        return json.loads(cached.video_json) if cached.video_json else None
+    _cache_stats["misses"] += 1
+    try:
+        save_youtube_cache(key, json.dumps(video, ensure_ascii=False) if video else None, time.time())
+    except Exception as e:
+        print("[YouTube cache ERROR]", e)
+    return video
+
+
+def _search_video(hero: str) -> Optional[Dict[str, str]]:
     yt = _get_service()
     try:
         items: List[dict] = []
@@ -83,7 +302,7 @@ def find_video_for_hero(hero: str) -> Optional[Dict[str, str]]:
             }
         return None
 
-    except HttpError as e:
+    except _http_error() as e:
         try:
             err = json.loads(e.content.decode())
         except Exception:
@@ -106,7 +325,7 @@ def youtube_ping_global():
                 "title": snip.get("title"),
             })
         return out
-    except HttpError as e:
+    except _http_error() as e:
         try:
             err = json.loads(e.content.decode())
         except Exception:
@@ -131,7 +350,7 @@ def youtube_channel_ping(hero: str):
                 "title": snip.get("title"),
             })
         return out
-    except HttpError as e:
+    except _http_error() as e:
         try:
             err = json.loads(e.content.decode())
         except Exception:
@@ -1,7 +1,63 @@
 export const API_BASE = import.meta.env.VITE_API_BASE || "http://127.0.0.1:8000";
 
+// токен сессии из /tg/verify: с ним бэкенд не проверяет initData на каждом запросе
+let sessionToken: string | null = null;
+let sessionExpiresAt = 0;
+
+export function setSession(token: string, expiresAt: number) {
+    sessionToken = token;
+    sessionExpiresAt = expiresAt;
+}
+
+export function hasSession(): boolean {
+    return !!sessionToken && sessionExpiresAt * 1000 > Date.now();
+}
+
+function authHeaders(): Record<string, string> {
+    return hasSession() ? { Authorization: `Bearer ${sessionToken}` } : {};
+}
+
+// сессию продлевает повторный /tg/verify (tg.ts регистрирует его в main.tsx — без циклического импорта)
+const SESSION_RENEW_MARGIN_MS = 60_000;
+let sessionRenewer: (() => Promise<unknown>) | null = null;
+let renewing: Promise<unknown> | null = null;
+
+export function setSessionRenewer(fn: () => Promise<unknown>) {
+    sessionRenewer = fn;
+}
+
+// одновременные запросы ждут один общий /tg/verify; true — сессия снова есть
+export async function renewSession(): Promise<boolean> {
+    if (!sessionRenewer) return false;
+    if (!renewing) {
+        renewing = sessionRenewer()
+            .catch(err => console.warn("[TG verify]", err))
+            .finally(() => { renewing = null; });
+    }
+    await renewing;
+    return hasSession();
+}
+
+function sessionExpiring(): boolean {
+    return !!sessionToken && sessionExpiresAt * 1000 - Date.now() < SESSION_RENEW_MARGIN_MS;
+}
+
+// fetch с токеном сессии: истекающую сессию продлеваем заранее, на 401 — продлеваем и повторяем один раз
+async function send(path: string, init: RequestInit = {}): Promise<Response> {
+    if (renewing || sessionExpiring()) await renewSession();
+    const attempt = () => fetch(`${API_BASE}${path}`, {
+        ...init,
+        headers: { ...(init.headers as Record<string, string>), ...authHeaders() },
+    });
+    const sent = sessionToken;
+    const r = await attempt();
+    // повторяем, только если /tg/verify выдал новый токен
+    if (r.status === 401 && sessionRenewer && await renewSession() && sessionToken !== sent) return attempt();
+    return r;
+}
+
 async function post<T>(path: string, body: any): Promise<T> {
-    const r = await fetch(`${API_BASE}${path}`, {
+    const r = await send(path, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(body),
@@ -14,7 +70,7 @@ async function post<T>(path: string, body: any): Promise<T> {
 }
 
 async function get<T>(path: string): Promise<T> {
-    const r = await fetch(`${API_BASE}${path}`);
+    const r = await send(path);
     if (!r.ok) {
         const msg = await r.text().catch(() => r.statusText);
         throw new Error(`${r.status} ${msg}`);
@@ -22,13 +78,57 @@ async function get<T>(path: string): Promise<T> {
     return r.json();
 }
 
+// POST + Server-Sent Events: onChunk получает куски по мере генерации, промис — полный текст
+async function postStream(path: string, body: any, onChunk: (text: string) => void): Promise<string> {
+    const r = await send(path, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+        body: JSON.stringify(body),
+    });
+    if (!r.ok || !r.body) {
+        const msg = await r.text().catch(() => r.statusText);
+        throw new Error(`${r.status} ${msg}`);
+    }
+    const reader = r.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    let full = "";
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let sep: number;
+        while ((sep = buf.indexOf("\n\n")) >= 0) {
+            const raw = buf.slice(0, sep);
+            buf = buf.slice(sep + 2);
+            const isDone = raw.split("\n").some(l => l === "event: done");
+            const isError = raw.split("\n").some(l => l === "event: error");
+            const data = raw.split("\n").filter(l => l.startsWith("data: ")).map(l => l.slice(6)).join("\n");
+            if (!data) continue;
+            // ответ оборвался посреди генерации — показанный кусок неполный
+            if (isError) throw new Error(JSON.parse(data).error ?? "stream error");
+            const text: string = JSON.parse(data).text ?? "";
+            if (isDone) {
+                full = text;
+            } else {
+                full += text;
+                onChunk(full);
+            }
+        }
+    }
+    return full;
+}
+
 export type HeroesRemaining = { remaining: string[]; used_count: number; total: number; };
 
 export const api = {
     health: () => get<{ status: string }>("/health"),
     heroesRemaining: () => get<HeroesRemaining>("/heroes/remaining"),
     pickHero: () => post<{ hero: string }>("/heroes/pick", {}),
-    markUsed: (hero: string) => post("/heroes/mark-used", { hero }),
+    // reservation_id — из ответа /post/compose (/heroes/reserve): без него забронированный герой даёт 409
+    markUsed: (hero: string, reservation_id?: string | null) =>
+        post("/heroes/mark-used", { hero, reservation_id: reservation_id || undefined }),
+    releaseHero: (reservation_id: string) => post<{ ok: boolean; hero: string }>("/heroes/release", { reservation_id }),
 
     // AI
     counterPick: (enemy: string, lane?: string, role?: string) =>
@@ -42,12 +142,32 @@ export const api = {
             "/quiz/generate", { topic, difficulty }
         ),
 
-    quizCheck: (quiz_id: number, answer_index: number) =>
+    // init_data (Telegram) — чтобы ответ попал в рейтинг пользователя; при живой сессии не нужен
+    quizCheck: (quiz_id: number, answer_index: number, init_data?: string | null) =>
         post<{ correct: boolean; correct_index: number; explanation: string; question: string; options: string[] }>(
-            "/quiz/check", { quiz_id, answer_index }
+            "/quiz/check", { quiz_id, answer_index, init_data: hasSession() ? undefined : init_data || undefined }
+        ),
+
+    quizCheckBatch: (answers: { quiz_id: number; answer_index: number }[], init_data?: string | null) =>
+        post<{
+            total: number;
+            correct_count: number;
+            results: { quiz_id: number; found: boolean; correct: boolean; correct_index?: number; explanation?: string }[];
+        }>("/quiz/check-batch", { answers, init_data: hasSession() ? undefined : init_data || undefined }),
+
+    quizLeaderboard: (limit = 10) =>
+        get<{ items: { rank: number; username: string | null; correct: number; answered: number }[] }>(
+            `/quiz/leaderboard?limit=${limit}`
         ),
 
     dailyGenerate: () => post<{ date: string; text: string; cached: boolean }>("/daily/generate", {}),
 
     patchExplain: (notes_text: string) => post<{ summary: string }>("/ai/patch-explain", { notes_text }),
+
+    // стриминговые варианты: onChunk вызывается с уже накопленным текстом
+    counterPickStream: (enemy: string, onChunk: (text: string) => void, lane?: string, role?: string) =>
+        postStream("/ai/counter-pick/stream", { enemy, lane, role }, onChunk),
+
+    patchExplainStream: (notes_text: string, onChunk: (text: string) => void) =>
+        postStream("/ai/patch-explain/stream", { notes_text }, onChunk),
 };
@@ -3,10 +3,13 @@ import { createRoot } from 'react-dom/client'
 import './index.css'
 import App from './App.tsx'
 import { initTelegram, verifyInitData } from './tg'
+import { renewSession, setSessionRenewer } from './api'
 
 // Init Telegram Mini App integration (safe in browser too)
 initTelegram()
-verifyInitData().catch(err => console.warn('[TG verify]', err))
+// сессия живёт TG_SESSION_TTL: api.ts перевыпускает её через /tg/verify перед истечением и на 401
+setSessionRenewer(verifyInitData)
+renewSession()
 
 createRoot(document.getElementById('root')!).render(
   <StrictMode>
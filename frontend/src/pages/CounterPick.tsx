@@ -12,8 +12,8 @@ export default function CounterPick() {
         if (!enemy.trim()) return;
         setAnswer("Генерирую рекомендации против героя...");
         try {
-            const res = await api.counterPick(enemy.trim(), lane || undefined, role || undefined);
-            setAnswer(res.answer);
+            const text = await api.counterPickStream(enemy.trim(), setAnswer, lane || undefined, role || undefined);
+            setAnswer(text);
         } catch (e: any) {
             setAnswer("Ошибка: " + e.message);
         }
@@ -9,8 +9,8 @@ export default function PatchExplainer() {
         if (!raw.trim()) return;
         setSummary("Готовлю краткое объяснение патча...");
         try {
-            const res = await api.patchExplain(raw);
-            setSummary(res.summary);
+            const text = await api.patchExplainStream(raw, setSummary);
+            setSummary(text);
         } catch (e: any) {
             setSummary("Ошибка: " + e.message);
         }
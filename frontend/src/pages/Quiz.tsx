@@ -1,5 +1,6 @@
 import { useState } from "react";
 import { api } from "../api";
+import { getInitData } from "../tg";
 
 export default function Quiz() {
     const [topic, setTopic] = useState("");
@@ -18,7 +19,7 @@ export default function Quiz() {
     const check = async (idx: number) => {
         if (!quiz) return;
         setPicked(idx);
-        const res = await api.quizCheck(quiz.quiz_id, idx);
+        const res = await api.quizCheck(quiz.quiz_id, idx, getInitData());
         setResult(res.correct ? "Верно" : "Неверно");
     };
 
@@ -1,5 +1,5 @@
 // Lightweight Telegram Web Apps SDK helper (safe to use in browser)
-import { API_BASE } from "./api";
+import { API_BASE, setSession } from "./api";
 
 type TG = typeof window & { Telegram?: any };
 
@@ -25,7 +25,7 @@ export function getInitData(): string | null {
   return initData;
 }
 
-export async function verifyInitData(): Promise<{ ok: boolean } | null> {
+export async function verifyInitData(): Promise<{ ok: boolean; session_token?: string; expires_at?: number } | null> {
   const initData = getInitData();
   if (!initData) return null; // local browser without Telegram
   const r = await fetch(`${API_BASE}/tg/verify`, {
@@ -37,6 +37,9 @@ export async function verifyInitData(): Promise<{ ok: boolean } | null> {
     const msg = await r.text().catch(() => r.statusText);
     throw new Error(`TG verify ${r.status}: ${msg}`);
   }
-  return r.json();
+  const res = await r.json();
+  // дальше запросы идут с токеном сессии вместо initData
+  if (res.session_token) setSession(res.session_token, res.expires_at);
+  return res;
 }
 